@@ -1,6 +1,6 @@
 import jwt
 from datetime import datetime, timedelta, timezone
-from fastapi import Header, HTTPException
+from fastapi import Header, HTTPException, Query
 from app.config import JWT_SECRET
 
 
@@ -15,7 +15,15 @@ def create_token() -> str:
 def verify_token(authorization: str = Header(...)) -> str:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid token format")
-    token = authorization.removeprefix("Bearer ")
+    return _decode(authorization.removeprefix("Bearer "))
+
+
+def verify_token_query(token: str = Query(...)) -> str:
+    """Токен в query-параметре — для EventSource, который не умеет заголовки."""
+    return _decode(token)
+
+
+def _decode(token: str) -> str:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
         return payload["sub"]
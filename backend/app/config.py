@@ -8,3 +8,75 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 JWT_SECRET = os.getenv("JWT_SECRET", "changeme-secret")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "changeme")
+
+# База данных: размер пула соединений и таймаут одного запроса (сек)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "15"))
+
+# События: размер очереди одного подписчика; webhook бота для уведомлений
+# о завершении обработки (пусто — уведомления выключены) и его секрет
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "1000"))
+BOT_WEBHOOK_URL = os.getenv("BOT_WEBHOOK_URL", "")
+BOT_WEBHOOK_SECRET = os.getenv("BOT_WEBHOOK_SECRET", "")
+# Интервал keepalive-комментария в потоке /api/events (сек)
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+
+# Кэш таблицы settings: через сколько перечитывать её из БД (сек)
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "60"))
+
+# Кэш ответов /api/analytics: число периодов и время жизни (сек)
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "128"))
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "300"))
+
+# Очередь обработки: каталог spool (SQLite + аудио), число воркеров,
+# heartbeat, порог «протухания» задачи, число попыток, ожидание при остановке (сек)
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "2"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "60"))
+
+# Ограничения pipeline: бюджет памяти под аудио (МБ), параллельность этапов
+# (для транскрибации — одновременных запросов STT, включая части длинных записей),
+# Retry-After (сек) для отклонённых загрузок
+PIPELINE_MEMORY_BUDGET_MB = int(os.getenv("PIPELINE_MEMORY_BUDGET_MB", "256"))
+COMPRESS_CONCURRENCY = int(os.getenv("COMPRESS_CONCURRENCY", "1"))
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+ANALYZE_CONCURRENCY = int(os.getenv("ANALYZE_CONCURRENCY", "4"))
+UPLOAD_RETRY_AFTER = int(os.getenv("UPLOAD_RETRY_AFTER", "30"))
+
+# Приём загрузок: максимальный размер файла (МБ, лимит Pyrogram — 2 ГБ),
+# глубина очереди и запас свободного места в spool (МБ), без которых API
+# отвечает 503, и сколько живёт сессия возобновляемой загрузки без новых чанков (сек)
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "2048"))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "50"))
+MIN_FREE_DISK_MB = int(os.getenv("MIN_FREE_DISK_MB", "1024"))
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", "86400"))
+
+# Максимальное время одного запуска ffmpeg (сек)
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "1800"))
+
+# Вырезание тишины перед транскрибацией (выключено по умолчанию):
+# порог тишины (дБ), минимальная длина паузы и запас по краям речи (сек)
+TRIM_SILENCE = os.getenv("TRIM_SILENCE", "0") == "1"
+SILENCE_NOISE_DB = float(os.getenv("SILENCE_NOISE_DB", "-35"))
+SILENCE_MIN_DURATION = float(os.getenv("SILENCE_MIN_DURATION", "2.0"))
+SILENCE_PADDING = float(os.getenv("SILENCE_PADDING", "0.3"))
+
+# Транскрибация длинных записей по частям: целевая длина части и перекрытие
+# соседних частей (сек)
+STT_CHUNK_SECONDS = float(os.getenv("STT_CHUNK_SECONDS", "600"))
+STT_CHUNK_OVERLAP = float(os.getenv("STT_CHUNK_OVERLAP", "15"))
+
+# OpenRouter: размер пула соединений, число повторов на 429/5xx,
+# база и потолок экспоненциальной задержки между повторами (сек)
+OPENROUTER_POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "20"))
+OPENROUTER_MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "4"))
+OPENROUTER_BACKOFF_BASE = float(os.getenv("OPENROUTER_BACKOFF_BASE", "1"))
+OPENROUTER_BACKOFF_MAX = float(os.getenv("OPENROUTER_BACKOFF_MAX", "60"))
+
+# Переанализ после смены промпта: одновременных запросов к LLM
+# и записей в одной выборке
+REANALYSIS_CONCURRENCY = int(os.getenv("REANALYSIS_CONCURRENCY", "2"))
+REANALYSIS_BATCH = int(os.getenv("REANALYSIS_BATCH", "50"))
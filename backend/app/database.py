@@ -1,4 +1,116 @@
-from supabase import create_client, Client
-from app.config import SUPABASE_URL, SUPABASE_KEY
+import asyncio
+from typing import Optional
+import httpx
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+from app.config import SUPABASE_URL, SUPABASE_KEY, DB_TIMEOUT, DB_POOL_SIZE
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+class DatabaseTimeout(Exception):
+    """Запрос к БД не уложился в таймаут."""
+
+
+# Объёмные текстовые колонки recordings: полная транскрипция часового урока —
+# десятки КБ. Списки и агрегаты их не выбирают; явно (heavy=True) их запрашивают
+# только карточка клиента и выборка частых ошибок (не больше 5 строк).
+HEAVY_COLUMNS = frozenset({"transcription", "analysis"})
+
+
+def _split_columns(select: str) -> list[str]:
+    """Делит список колонок по запятым верхнего уровня (не внутри rel(...))."""
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(select):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(select[start:i])
+            start = i + 1
+    parts.append(select[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _check_columns(select: str):
+    for column in _split_columns(select):
+        head, _, embedded = column.partition("(")
+        name = head.split(":")[-1].split("!")[0].strip()
+        if embedded:
+            # Встроенная выборка rel(...) — те же правила для её колонок
+            _check_columns(embedded.rsplit(")", 1)[0])
+        elif name == "*" or name in HEAVY_COLUMNS:
+            raise ValueError(f"Column '{name}' must be requested with heavy=True")
+
+
+def projection(*columns: str, heavy: bool = False) -> str:
+    """Явный список колонок для select(). Без heavy=True "*" и тяжёлые колонки
+    запрещены — в том числе внутри встроенных выборок rel(...)."""
+    select = ", ".join(columns)
+    if not heavy:
+        _check_columns(select)
+    return select
+
+
+_client: Optional[AsyncClient] = None
+_http: Optional[httpx.AsyncClient] = None
+
+
+async def connect(timeout: float = DB_TIMEOUT):
+    """Создаёт асинхронный клиент Supabase с общим пулом соединений.
+
+    timeout — таймаут HTTP-запроса к PostgREST; долгим служебным задачам
+    (пересборка rollup) нужен свой, больший.
+    """
+    global _client, _http
+    if _client is not None:
+        return
+    _http = httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=DB_POOL_SIZE,
+            max_keepalive_connections=DB_POOL_SIZE,
+        ),
+    )
+    _client = await acreate_client(
+        SUPABASE_URL,
+        SUPABASE_KEY,
+        options=AsyncClientOptions(
+            postgrest_client_timeout=timeout,
+            httpx_client=_http,
+        ),
+    )
+
+
+async def disconnect():
+    global _client, _http
+    if _http is not None:
+        await _http.aclose()
+    _client = None
+    _http = None
+
+
+def _get_client() -> AsyncClient:
+    if _client is None:
+        raise RuntimeError("Database is not connected, call connect() on startup")
+    return _client
+
+
+def table(name: str):
+    """Построитель запроса к таблице (выполняется через execute)."""
+    return _get_client().table(name)
+
+
+def rpc(fn: str, params: Optional[dict] = None):
+    """Построитель вызова Postgres-функции (выполняется через execute)."""
+    return _get_client().rpc(fn, params or {})
+
+
+async def execute(query, timeout: float = DB_TIMEOUT):
+    """Выполняет запрос без блокировки event loop, с таймаутом на вызов.
+
+    Таймаут httpx (он срабатывает раньше или одновременно) — тоже
+    DatabaseTimeout, а не голая ошибка httpx.
+    """
+    try:
+        return await asyncio.wait_for(query.execute(), timeout)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        raise DatabaseTimeout(f"Database query exceeded {timeout}s")
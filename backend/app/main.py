@@ -1,19 +1,58 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import employees, recordings, clients, analytics, auth, settings
-from app.database import supabase
+from fastapi.responses import JSONResponse
+from app.routers import employees, recordings, clients, analytics, auth, settings, reanalysis, events
+from app.database import connect, disconnect, execute, table, DatabaseTimeout
 from app.config import ADMIN_PASSWORD
+from app.services.analytics_cache import analytics_cache
+from app.services.jobs import job_queue
+from app.services.uploads import upload_sessions
+from app.services.pipeline import worker_pool
+from app.services.reanalysis import reanalysis_runner
+from app.services.limits import limits_stats
+from app.services.settings_cache import settings_cache
+from app.services.events import event_bus
+from app.services.notifier import bot_notifier
+from app.services.openrouter import open_client, close_client, openrouter_stats
 
 app = FastAPI(title="Beethoven API", version="1.0.0")
 
 
 @app.on_event("startup")
+async def startup():
+    await connect()
+    await open_client()
+    await sync_admin_password()
+    await settings_cache.load()
+    await job_queue.open()
+    await upload_sessions.open()
+    bot_notifier.start()
+    # Воркеры сразу возвращают в очередь задачи, оборванные прошлым процессом
+    worker_pool.start()
+    # Переанализ, прерванный рестартом, подхватывается по протухшему heartbeat
+    reanalysis_runner.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await reanalysis_runner.stop()
+    await worker_pool.stop()
+    await bot_notifier.stop()
+    await close_client()
+    await disconnect()
+
+
 async def sync_admin_password():
     """Синхронизирует пароль из .env в БД при запуске."""
     if ADMIN_PASSWORD and ADMIN_PASSWORD != "changeme":
-        supabase.table("settings").update(
+        await execute(table("settings").update(
             {"value": ADMIN_PASSWORD}
-        ).eq("key", "admin_password").execute()
+        ).eq("key", "admin_password"))
+
+
+@app.exception_handler(DatabaseTimeout)
+async def database_timeout_handler(request: Request, exc: DatabaseTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,8 +68,24 @@ app.include_router(clients.router)
 app.include_router(analytics.router)
 app.include_router(auth.router)
 app.include_router(settings.router)
+app.include_router(reanalysis.router)
+app.include_router(events.router)
 
 
 @app.get("/api/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/api/metrics")
+async def metrics():
+    return {
+        "analytics_cache": analytics_cache.stats(),
+        "settings_cache": settings_cache.stats(),
+        "jobs": await job_queue.counts(),
+        "workers": {"size": worker_pool.size, "busy": worker_pool.busy},
+        "limits": limits_stats(),
+        "events": event_bus.stats(),
+        "notifications": bot_notifier.stats(),
+        "openrouter": openrouter_stats(),
+    }
@@ -0,0 +1,28 @@
+"""Пересборка rollup-таблиц аналитики из сырых данных.
+
+Запуск: python -m app.rollups
+Нужен один раз после применения supabase_analytics.sql на существующей базе
+и после ручных правок данных в обход API.
+"""
+import asyncio
+import logging
+from app.database import connect, disconnect, execute, rpc
+
+logger = logging.getLogger(__name__)
+
+REBUILD_TIMEOUT = 600
+
+
+async def rebuild():
+    # Свой клиент с долгим таймаутом: у общего он DB_TIMEOUT на любой запрос
+    await connect(timeout=REBUILD_TIMEOUT)
+    try:
+        await execute(rpc("analytics_rollup_rebuild"), timeout=REBUILD_TIMEOUT)
+    finally:
+        await disconnect()
+    logger.info("Analytics rollups rebuilt")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(rebuild())
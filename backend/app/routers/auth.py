@@ -1,19 +1,17 @@
 from fastapi import APIRouter, HTTPException
-from app.database import supabase
 from app.schemas import LoginRequest, TokenOut
 from app.auth import create_token
+from app.services.settings_cache import settings_cache
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
 
 @router.post("/login", response_model=TokenOut)
 async def login(data: LoginRequest):
-    # Получаем пароль из настроек
-    result = supabase.table("settings").select("value").eq(
-        "key", "admin_password"
-    ).single().execute()
+    # Пароль из настроек (кэш в памяти процесса)
+    password = await settings_cache.admin_password()
 
-    if not result.data or data.password != result.data["value"]:
+    if not password or data.password != password:
         raise HTTPException(status_code=401, detail="Wrong password")
 
     token = create_token()
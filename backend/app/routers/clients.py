@@ -1,11 +1,28 @@
 from datetime import datetime, timedelta, timezone
 from fastapi import APIRouter, HTTPException, Depends, Query
-from app.database import supabase
+from app.database import execute, table, projection
 from app.schemas import ClientCard, ClientDetail, ClientUpdate, RecordingDetail, City, ClientResult
 from app.auth import verify_token
+from app.services.analytics_cache import analytics_cache
+from app.services.events import event_bus, client_event
 
 router = APIRouter(prefix="/api/clients", tags=["clients"])
 
+CLIENT_COLUMNS = projection("id", "name", "city", "lesson_datetime", "result")
+
+# Канбан: только то, что показывает карточка, без транскрипций и анализов
+CARD_COLUMNS = projection(
+    "id", "name", "city", "lesson_datetime", "result",
+    f"recordings({projection('score', 'status', 'employees(name, role)')})",
+)
+
+# Карточка клиента — единственное место, где грузятся полные тексты
+DETAIL_RECORDING_COLUMNS = projection(
+    "id", "transcription", "analysis", "score", "status",
+    "employees!inner(name, role, directions)",
+    heavy=True,
+)
+
 
 @router.get("", response_model=list[ClientCard])
 async def get_clients(
@@ -22,21 +39,17 @@ async def get_clients(
 
     end = start + timedelta(days=7)
 
-    clients = supabase.table("clients").select("*").eq(
+    # Клиенты недели вместе с записями и сотрудниками — одним запросом
+    clients = await execute(table("clients").select(CARD_COLUMNS).eq(
         "city", city.value
     ).gte(
         "lesson_datetime", start.isoformat()
     ).lt(
         "lesson_datetime", end.isoformat()
-    ).order("lesson_datetime").execute()
+    ).order("lesson_datetime"))
 
     cards = []
     for c in clients.data:
-        # Получаем записи для этого клиента
-        recs = supabase.table("recordings").select(
-            "*, employees!inner(name, role)"
-        ).eq("client_id", c["id"]).execute()
-
         teacher_name = None
         manager_name = None
         teacher_score = None
@@ -44,8 +57,8 @@ async def get_clients(
         teacher_status = None
         manager_status = None
 
-        for r in recs.data:
-            emp = r.get("employees", {})
+        for r in c.get("recordings") or []:
+            emp = r.get("employees") or {}
             if emp.get("role") == "teacher":
                 teacher_name = emp.get("name")
                 teacher_score = r.get("score")
@@ -75,15 +88,15 @@ async def get_clients(
 @router.get("/{client_id}", response_model=ClientDetail)
 async def get_client_detail(client_id: str, _: str = Depends(verify_token)):
     """Детальная информация о клиенте с записями."""
-    client = supabase.table("clients").select("*").eq(
+    client = await execute(table("clients").select(CLIENT_COLUMNS).eq(
         "id", client_id
-    ).single().execute()
+    ).single())
     if not client.data:
         raise HTTPException(status_code=404, detail="Client not found")
 
-    recs = supabase.table("recordings").select(
-        "*, employees!inner(name, role, directions)"
-    ).eq("client_id", client_id).execute()
+    recs = await execute(table("recordings").select(
+        DETAIL_RECORDING_COLUMNS
+    ).eq("client_id", client_id))
 
     recordings = []
     for r in recs.data:
@@ -113,7 +126,7 @@ async def get_client_detail(client_id: str, _: str = Depends(verify_token)):
 async def update_client(client_id: str, body: ClientUpdate, _: str = Depends(verify_token)):
     """Редактирование клиента."""
     # Проверяем существование
-    existing = supabase.table("clients").select("*").eq("id", client_id).execute()
+    existing = await execute(table("clients").select("id, city").eq("id", client_id))
     if not existing.data:
         raise HTTPException(status_code=404, detail="Client not found")
 
@@ -134,7 +147,10 @@ async def update_client(client_id: str, body: ClientUpdate, _: str = Depends(ver
     if not update_data:
         raise HTTPException(status_code=400, detail="No fields to update")
 
-    supabase.table("clients").update(update_data).eq("id", client_id).execute()
+    await execute(table("clients").update(update_data).eq("id", client_id))
+    city = existing.data[0]["city"]
+    analytics_cache.invalidate_city(city)
+    event_bus.publish(client_event("updated", client_id, city, **update_data))
 
     return await get_client_detail(client_id, _)
 
@@ -142,12 +158,15 @@ async def update_client(client_id: str, body: ClientUpdate, _: str = Depends(ver
 @router.delete("/{client_id}")
 async def delete_client(client_id: str, _: str = Depends(verify_token)):
     """Удаление клиента (записи удалятся каскадно)."""
-    existing = supabase.table("clients").select("id").eq("id", client_id).execute()
+    existing = await execute(table("clients").select("id, city").eq("id", client_id))
     if not existing.data:
         raise HTTPException(status_code=404, detail="Client not found")
 
     # Удаляем связанные записи вручную (на случай если нет CASCADE)
-    supabase.table("recordings").delete().eq("client_id", client_id).execute()
-    supabase.table("clients").delete().eq("id", client_id).execute()
+    await execute(table("recordings").delete().eq("client_id", client_id))
+    await execute(table("clients").delete().eq("id", client_id))
+    city = existing.data[0]["city"]
+    analytics_cache.invalidate_city(city)
+    event_bus.publish(client_event("deleted", client_id, city))
 
     return {"ok": True}
@@ -1,16 +1,20 @@
-from fastapi import APIRouter, HTTPException
-from app.database import supabase
-from app.schemas import EmployeeCreate, EmployeeOut
+from fastapi import APIRouter, HTTPException, Query
+from app.database import execute, table
+from app.schemas import EmployeeCreate, EmployeeOut, City
+from app.services.analytics_cache import analytics_cache
 
 router = APIRouter(prefix="/api/employees", tags=["employees"])
 
+# Сколько telegram_id принимает один batch-запрос
+BATCH_LIMIT = 500
+
 
 @router.post("", response_model=EmployeeOut)
 async def create_employee(data: EmployeeCreate):
     # Проверяем, не зарегистрирован ли уже
-    existing = supabase.table("employees").select("*").eq(
+    existing = await execute(table("employees").select("*").eq(
         "telegram_id", data.telegram_id
-    ).execute()
+    ))
     if existing.data:
         raise HTTPException(status_code=409, detail="Employee already registered")
 
@@ -21,15 +25,27 @@ async def create_employee(data: EmployeeCreate):
         "city": data.city.value,
         "directions": [d.value for d in data.directions],
     }
-    result = supabase.table("employees").insert(row).execute()
+    result = await execute(table("employees").insert(row))
     return result.data[0]
 
 
+@router.get("", response_model=list[EmployeeOut])
+async def get_employees(telegram_id: list[int] = Query(...)):
+    """Профили нескольких сотрудников одним запросом (прогрев кэша бота).
+    Незарегистрированных в ответе просто нет."""
+    if len(telegram_id) > BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_LIMIT} telegram_id per request")
+    result = await execute(table("employees").select("*").in_(
+        "telegram_id", list(set(telegram_id))
+    ))
+    return result.data
+
+
 @router.get("/{telegram_id}", response_model=EmployeeOut)
 async def get_employee(telegram_id: int):
-    result = supabase.table("employees").select("*").eq(
+    result = await execute(table("employees").select("*").eq(
         "telegram_id", telegram_id
-    ).execute()
+    ))
     if not result.data:
         raise HTTPException(status_code=404, detail="Employee not found")
     return result.data[0]
@@ -37,12 +53,16 @@ async def get_employee(telegram_id: int):
 
 @router.put("/{telegram_id}", response_model=EmployeeOut)
 async def update_employee(telegram_id: int, data: EmployeeCreate):
-    result = supabase.table("employees").update({
+    result = await execute(table("employees").update({
         "name": data.name,
         "role": data.role.value,
         "city": data.city.value,
         "directions": [d.value for d in data.directions],
-    }).eq("telegram_id", telegram_id).execute()
+    }).eq("telegram_id", telegram_id))
     if not result.data:
         raise HTTPException(status_code=404, detail="Employee not found")
+    # Имя, роль и направления видны в аналитике всех городов, где у сотрудника
+    # есть записи (rollup по направлениям пересчитан триггером)
+    for city in City:
+        analytics_cache.invalidate_city(city.value)
     return result.data[0]
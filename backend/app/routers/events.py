@@ -0,0 +1,51 @@
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from app.auth import verify_token_query
+from app.config import SSE_KEEPALIVE
+from app.schemas import City
+from app.services.events import event_bus, Event
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+
+@router.get("")
+async def stream_events(
+    request: Request,
+    city: Optional[City] = Query(None),
+    recording_id: Optional[str] = Query(None),
+    _: str = Depends(verify_token_query),
+):
+    """Server-Sent Events: статусы записей и изменения клиентов.
+
+    event: recording — {"recording_id", "client_id", "role", "status", "city", "score"?}
+    event: client    — {"action": "created" | "updated" | "deleted", "client_id", "city", ...}
+    После переподключения клиенту стоит перечитать данные: пропущенные
+    события не повторяются.
+    """
+    def matches(event: Event) -> bool:
+        if city and event.get("city") != city.value:
+            return False
+        if recording_id and event.get("recording_id") != recording_id:
+            return False
+        return True
+
+    async def stream():
+        with event_bus.subscribe(matches) as sub:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(sub.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Комментарий не даёт прокси закрыть «молчащее» соединение
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
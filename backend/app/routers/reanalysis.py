@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Depends
+from app.schemas import ReanalysisCreate, ReanalysisOut
+from app.auth import verify_token
+from app.services.reanalysis import reanalysis_runner, ReanalysisConflict
+
+router = APIRouter(prefix="/api/reanalysis", tags=["reanalysis"])
+
+
+@router.post("", response_model=ReanalysisOut)
+async def start_reanalysis(data: ReanalysisCreate, _: str = Depends(verify_token)):
+    """Переанализ готовых записей текущим промптом (город и период — необязательные фильтры)."""
+    if data.date_from and data.date_to and data.date_from > data.date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    try:
+        return await reanalysis_runner.create(
+            data.prompt_key.value,
+            data.city.value if data.city else None,
+            data.date_from,
+            data.date_to,
+        )
+    except ReanalysisConflict as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Reanalysis {e.run['id']} of the same prompt and records is already running",
+        )
+
+
+@router.get("", response_model=list[ReanalysisOut])
+async def list_reanalysis(_: str = Depends(verify_token)):
+    return await reanalysis_runner.recent()
+
+
+@router.get("/{run_id}", response_model=ReanalysisOut)
+async def get_reanalysis(run_id: str, _: str = Depends(verify_token)):
+    run = await reanalysis_runner.get(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Reanalysis not found")
+    return run
+
+
+@router.post("/{run_id}/cancel", response_model=ReanalysisOut)
+async def cancel_reanalysis(run_id: str, _: str = Depends(verify_token)):
+    run = await reanalysis_runner.cancel(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Reanalysis not found")
+    return run
@@ -1,37 +1,100 @@
 import logging
 from datetime import datetime, timezone, timedelta
+from pathlib import Path
 from typing import Optional
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from app.database import supabase
-from app.schemas import RecordingOut, RecordingStatusOut, ClientResult, City
-from app.services.pipeline import run_pipeline_background
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+from app.database import execute, table, rpc, projection
+from app.schemas import (
+    RecordingCreate, RecordingOut, RecordingStatusOut, RetryResult, ClientResult, City, UploadCreate,
+    UploadOut,
+)
+from app.auth import verify_token
+from app.services.jobs import job_queue
+from app.services.spool import (
+    spool_multipart, file_sha256, SpoolWriter, UploadTooLarge, MAX_UPLOAD_BYTES, MAX_FORM_OVERHEAD,
+)
+from app.services.uploads import upload_sessions, UploadDataLost
+from app.services.pipeline import mark_failed
+from app.services.events import event_bus, recording_event, client_event
+from app.services.analytics_cache import analytics_cache
+from app.config import UPLOAD_RETRY_AFTER, MAX_QUEUED_JOBS, MIN_FREE_DISK_MB
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/recordings", tags=["recordings"])
 
+RETRY_COLUMNS = projection(
+    "id", "status", "stage", "score", "client_id", "employees!inner(role)", "clients!inner(city)",
+)
+# Сколько записей в ошибке повторяет один вызов массового retry
+RETRY_BATCH_LIMIT = 500
+
 
 @router.post("", response_model=RecordingOut)
-async def create_recording(
-    audio: UploadFile = File(...),
-    employee_telegram_id: int = Form(...),
-    client_name: str = Form(...),
-    lesson_datetime: str = Form(...),
-    result: Optional[ClientResult] = Form(None),
-    city: City = Form(...),
-):
-    audio_bytes = await audio.read()
-    logger.info(f"Recording: employee={employee_telegram_id}, client={client_name}, dt={lesson_datetime}, result={result}, city={city}, audio={len(audio_bytes)} bytes")
-
-    # 1. Находим сотрудника
-    emp = supabase.table("employees").select("*").eq(
-        "telegram_id", employee_telegram_id
-    ).execute()
-    if not emp.data:
-        raise HTTPException(status_code=404, detail="Employee not found")
-    employee = emp.data[0]
+async def create_recording(request: Request):
+    """Загрузка аудио + метаданные: multipart/form-data с файлом audio, полями
+    RecordingCreate и необязательным idempotency_key.
+
+    Форма разбирается вручную: параметры File/Form заставили бы FastAPI
+    принять всё тело до вызова обработчика. Здесь заявленный Content-Length
+    и admission control проверяются до чтения тела, а файл идёт потоком
+    прямо в spool.
+    """
+    declared = request.headers.get("content-length", "")
+    size = int(declared) if declared.isdigit() else None
+    if size is not None and size > MAX_UPLOAD_BYTES + MAX_FORM_OVERHEAD:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    await _check_admission(size)
+
+    upload_path = job_queue.new_upload_path()
+    try:
+        fields, size, audio_hash = await spool_multipart(request, upload_path, "audio")
+        try:
+            form = RecordingCreate.model_validate(fields)
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+            )
+        logger.info(f"Recording: employee={form.employee_telegram_id}, client={form.client_name}, dt={form.lesson_datetime}, result={form.result}, city={form.city}, audio={size} bytes")
+        return await _ingest(
+            upload_path, audio_hash, form.employee_telegram_id, form.client_name, form.lesson_datetime,
+            form.result, form.city, fields.get("idempotency_key") or None,
+        )
+    finally:
+        # После постановки в очередь файл уже перенесён
+        upload_path.unlink(missing_ok=True)
 
-    # 2. Парсим дату (все пользователи в Казахстане, UTC+5)
+
+async def _check_admission(size: Optional[int] = None):
+    """Admission control: загрузка копируется на диск чанками и ждёт в очереди.
+    Принимаем, пока очередь не переполнена и в spool после заявленного размера
+    (size или Content-Length) остаётся MIN_FREE_DISK_MB. Иначе — 503 с Retry-After.
+    Память здесь не при чём: сырой файл в неё не попадает, бюджет памяти
+    ограничивает только этапы pipeline."""
+    counts = await job_queue.counts()
+    free = await job_queue.free_bytes()
+    if counts.get("queued", 0) >= MAX_QUEUED_JOBS or free - (size or 0) < MIN_FREE_DISK_MB * 1024 * 1024:
+        raise HTTPException(
+            status_code=503,
+            detail="Pipeline is busy, retry later",
+            headers={"Retry-After": str(UPLOAD_RETRY_AFTER)},
+        )
+
+
+async def _ingest(
+    upload_path: Path,
+    audio_hash: str,
+    employee_telegram_id: int,
+    client_name: str,
+    lesson_datetime: str,
+    result: Optional[ClientResult],
+    city: City,
+    idempotency_key: Optional[str] = None,
+) -> dict:
+    # 1. Парсим дату (все пользователи в Казахстане, UTC+5)
     KZ_TZ = timezone(timedelta(hours=5))
     try:
         parsed_dt = datetime.strptime(lesson_datetime, "%d.%m.%Y %H:%M")
@@ -39,50 +102,245 @@ async def create_recording(
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid datetime format. Use DD.MM.YYYY HH:MM")
 
-    dt_iso = parsed_dt.isoformat()
+    # 2. Сотрудник, клиент (создаётся или получает результат) и запись —
+    #    одной транзакцией в БД (supabase_schema.sql: ingest_recording)
+    ingested = await execute(rpc("ingest_recording", {
+        "p_telegram_id": employee_telegram_id,
+        "p_client_name": client_name,
+        "p_city": city.value,
+        "p_lesson_datetime": parsed_dt.isoformat(),
+        "p_result": result.value if result else None,
+        "p_idempotency_key": idempotency_key,
+    }))
+    if not ingested.data:
+        raise HTTPException(status_code=404, detail="Employee not found")
+    employee = ingested.data["employee"]
+    client = ingested.data["client"]
+    recording = ingested.data["recording"]
+    if not ingested.data["created"]:
+        # Повтор загрузки с тем же ключом. Если прошлая попытка упала между
+        # созданием записи и постановкой в очередь — ставим задачу сейчас
+        if recording["stage"] == "analyzed" or await job_queue.has_job(recording["id"]):
+            logger.info(f"Recording {recording['id']}: duplicate upload ({idempotency_key}), not enqueued")
+            return recording
+        logger.warning(f"Recording {recording['id']}: created without a job, enqueueing on retry")
 
-    # 3. Находим или создаём клиента
-    existing_client = supabase.table("clients").select("*").eq(
-        "name", client_name
-    ).eq("city", city.value).eq("lesson_datetime", dt_iso).execute()
+    # 3. Ставим в персистентную очередь pipeline (аудио — во временный spool)
+    await job_queue.enqueue(recording["id"], employee["role"], city.value, upload_path, audio_hash)
 
-    if existing_client.data:
-        client = existing_client.data[0]
-        if result and not client.get("result"):
-            supabase.table("clients").update(
-                {"result": result.value}
-            ).eq("id", client["id"]).execute()
-    else:
-        client_data = {
-            "name": client_name,
-            "city": city.value,
-            "lesson_datetime": dt_iso,
-        }
-        if result:
-            client_data["result"] = result.value
-        client_res = supabase.table("clients").insert(client_data).execute()
-        client = client_res.data[0]
-
-    # 4. Создаём запись
-    rec = supabase.table("recordings").insert({
-        "client_id": client["id"],
-        "employee_id": employee["id"],
-        "audio_path": "",
-        "status": "pending",
-    }).execute()
-    recording = rec.data[0]
-
-    # 5. Запускаем pipeline в фоне с аудио байтами (без хранения файла)
-    run_pipeline_background(recording["id"], employee["role"], audio_bytes)
+    # Клиент мог появиться или получить результат — доска обновит карточку,
+    # а конверсия города пересчитается
+    analytics_cache.invalidate_city(city.value)
+    event_bus.publish(client_event(
+        "updated", client["id"], city.value,
+        name=client["name"], lesson_datetime=client["lesson_datetime"], result=client["result"],
+    ))
+    event_bus.publish(recording_event(
+        recording["id"], "pending", city.value, client_id=client["id"], role=employee["role"],
+    ))
+
+    return recording
+
+
+# --- Возобновляемая загрузка: сессия → чанки по смещению → finalize ---
+
+def _upload_out(session: dict) -> UploadOut:
+    return UploadOut(
+        id=session["id"],
+        offset=session["received"],
+        size=session["size"],
+        status=session["status"],
+        recording=session["recording"],
+    )
+
+
+async def _get_upload(upload_id: str) -> dict:
+    session = await upload_sessions.get(upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+@router.post("/uploads", response_model=UploadOut)
+async def create_upload(body: UploadCreate):
+    """Сессия загрузки. Тот же idempotency_key возвращает существующую сессию:
+    клиент продолжает с её offset, а после finalize получает готовую запись."""
+    if body.size is not None and body.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+    await _check_admission(body.size)
+    metadata = body.model_dump(mode="json", exclude={"idempotency_key", "size"})
+    session, _ = await upload_sessions.create(body.idempotency_key, metadata, body.size)
+    return _upload_out(session)
 
+
+@router.get("/uploads/{upload_id}", response_model=UploadOut)
+async def get_upload(upload_id: str):
+    """Сколько байт уже принято — с этого offset продолжать после обрыва."""
+    return _upload_out(await _get_upload(upload_id))
+
+
+@router.put("/uploads/{upload_id}", response_model=UploadOut)
+async def upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Дописывает тело запроса с позиции offset (должна совпадать с принятым).
+
+    При обрыве соединения принятая часть чанка засчитывается: клиент
+    узнаёт новый offset через GET и продолжает с него.
+    """
+    # Блокировка — только для существующей сессии
+    await _get_upload(upload_id)
+    async with upload_sessions.lock(upload_id):
+        session = await _get_upload(upload_id)
+        if session["status"] != "open":
+            raise HTTPException(status_code=409, detail="Upload is already finalized")
+        if offset != session["received"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Offset mismatch, expected {session['received']}",
+                headers={"Upload-Offset": str(session["received"])},
+            )
+        try:
+            await upload_sessions.truncate(upload_id, offset)
+        except UploadDataLost:
+            raise HTTPException(status_code=410, detail="Upload data is missing, start a new upload")
+        writer = SpoolWriter(upload_sessions.path(upload_id), MAX_UPLOAD_BYTES - offset)
+        try:
+            async with writer:
+                async for chunk in request.stream():
+                    await writer.write(chunk)
+        except UploadTooLarge as e:
+            await upload_sessions.truncate(upload_id, offset)
+            raise HTTPException(status_code=413, detail=str(e))
+        except ClientDisconnect:
+            await upload_sessions.set_received(upload_id, offset + writer.size)
+            raise
+        session["received"] = offset + writer.size
+        if session["size"] is not None and session["received"] > session["size"]:
+            await upload_sessions.truncate(upload_id, offset)
+            raise HTTPException(status_code=400, detail="Upload exceeds declared size")
+        await upload_sessions.set_received(upload_id, session["received"])
+    return _upload_out(session)
+
+
+@router.post("/uploads/{upload_id}/finalize", response_model=UploadOut)
+async def finalize_upload(upload_id: str):
+    """Создаёт запись из загруженного файла — ровно один раз.
+
+    Повторный вызов возвращает ту же запись: её хранит сессия, а если процесс
+    упал до этого, запись находится по ключу идемпотентности (ingest_recording
+    или, когда файл уже перенесён в очередь, _recover_finalized). Если данные
+    загрузки пропали — 410, загрузку надо начать заново.
+    """
+    await _get_upload(upload_id)
+    async with upload_sessions.lock(upload_id):
+        session = await _get_upload(upload_id)
+        if session["status"] == "done":
+            return _upload_out(session)
+        if session["size"] is not None and session["received"] != session["size"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload is incomplete: {session['received']} of {session['size']} bytes",
+                headers={"Upload-Offset": str(session["received"])},
+            )
+        # Admission проверен при создании сессии: файл уже на диске, и отказ
+        # здесь заставил бы клиента держать готовую загрузку и повторять finalize
+
+        metadata = session["metadata"]
+        upload_path = upload_sessions.path(upload_id)
+        if not upload_path.exists():
+            recording = await _recover_finalized(session)
+        else:
+            await upload_sessions.truncate(upload_id, session["received"])
+            audio_hash = await file_sha256(str(upload_path))
+            logger.info(f"Upload {upload_id}: {session['received']} bytes, finalizing")
+            # При ошибке файл остаётся: повторный finalize начнёт заново
+            recording = await _ingest(
+                upload_path, audio_hash,
+                metadata["employee_telegram_id"], metadata["client_name"], metadata["lesson_datetime"],
+                ClientResult(metadata["result"]) if metadata["result"] else None,
+                City(metadata["city"]),
+                session["idempotency_key"],
+            )
+            # После постановки в очередь файл уже перенесён; остаётся он только у дубля
+            upload_path.unlink(missing_ok=True)
+        await upload_sessions.complete(upload_id, recording)
+        session.update(status="done", recording=recording)
+    return _upload_out(session)
+
+
+async def _recover_finalized(session: dict) -> dict:
+    """Файла сессии нет: либо прошлый finalize успел поставить задачу (файл
+    перенесён в очередь) и упал до завершения сессии, либо данные пропали."""
+    existing = await execute(table("recordings").select(
+        "id, client_id, employee_id, audio_path, status, stage, created_at, clients!inner(city)"
+    ).eq("idempotency_key", session["idempotency_key"]))
+    if not existing.data:
+        raise HTTPException(status_code=410, detail="Upload data is missing, start a new upload")
+    recording = existing.data[0]
+    city = recording.pop("clients")["city"]
+    if recording["stage"] != "analyzed" and not await job_queue.has_job(recording["id"]):
+        await mark_failed(recording["id"], city, "upload data lost")
+        raise HTTPException(status_code=410, detail="Upload data is missing, start a new upload")
     return recording
 
 
 @router.get("/{recording_id}/status", response_model=RecordingStatusOut)
 async def get_recording_status(recording_id: str):
-    result = supabase.table("recordings").select("id, status").eq(
+    result = await execute(table("recordings").select("id, status, stage, error").eq(
         "id", recording_id
-    ).execute()
+    ))
     if not result.data:
         raise HTTPException(status_code=404, detail="Recording not found")
     return result.data[0]
+
+
+@router.post("/retry", response_model=RetryResult)
+async def retry_failed_recordings(_: str = Depends(verify_token)):
+    """Повтор всех записей в статусе error (каждая — с первого незавершённого этапа)."""
+    failed = await execute(table("recordings").select(RETRY_COLUMNS).eq(
+        "status", "error"
+    ).limit(RETRY_BATCH_LIMIT))
+    retried, skipped = [], []
+    for recording in failed.data:
+        (retried if await _retry(recording) else skipped).append(recording["id"])
+    return RetryResult(retried=retried, skipped=skipped)
+
+
+@router.post("/{recording_id}/retry", response_model=RecordingStatusOut)
+async def retry_recording(recording_id: str, _: str = Depends(verify_token)):
+    """Повтор обработки с первого незавершённого этапа, без повторной загрузки."""
+    result = await execute(table("recordings").select(RETRY_COLUMNS).eq("id", recording_id))
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    recording = result.data[0]
+    if recording["status"] != "error":
+        raise HTTPException(status_code=409, detail="Only failed recordings can be retried")
+    status = await _retry(recording)
+    if not status:
+        raise HTTPException(status_code=409, detail="Audio is no longer available, upload it again")
+    return {"id": recording_id, "status": status, "stage": recording["stage"]}
+
+
+async def _retry(recording: dict) -> Optional[str]:
+    """Возвращает запись в очередь. Сначала — упавшую задачу с сохранённым аудио;
+    если аудио уже нет, но транскрипция готова — задачу только на анализ.
+    Запись с сохранённым анализом повторять нечего — ей возвращается done.
+    Новый статус записи или None, если повторить нельзя."""
+    city, role = recording["clients"]["city"], recording["employees"]["role"]
+    if recording["stage"] == "analyzed":
+        status = "done"
+    else:
+        if not await job_queue.retry(recording["id"]):
+            if recording["stage"] != "transcribed":
+                return None
+            await job_queue.enqueue(recording["id"], role, city, None, None)
+        status = "pending"
+    await execute(table("recordings").update(
+        {"status": status, "error": None}
+    ).eq("id", recording["id"]))
+    if status == "done":
+        analytics_cache.invalidate_city(city)
+    event_bus.publish(recording_event(
+        recording["id"], status, city, client_id=recording["client_id"], role=role,
+        **({"score": recording["score"]} if status == "done" else {}),
+    ))
+    return status
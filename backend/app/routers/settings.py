@@ -1,20 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends
-from app.database import supabase
+from app.database import execute, table
 from app.schemas import SettingOut, SettingUpdate
 from app.auth import verify_token
+from app.services.settings_cache import settings_cache
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
 
 
 @router.get("", response_model=list[SettingOut])
 async def get_settings(_: str = Depends(verify_token)):
-    result = supabase.table("settings").select("*").execute()
+    result = await execute(table("settings").select("*"))
     return result.data
 
 
 @router.get("/{key}", response_model=SettingOut)
 async def get_setting(key: str, _: str = Depends(verify_token)):
-    result = supabase.table("settings").select("*").eq("key", key).single().execute()
+    result = await execute(table("settings").select("*").eq("key", key).single())
     if not result.data:
         raise HTTPException(status_code=404, detail="Setting not found")
     return result.data
@@ -22,9 +23,10 @@ async def get_setting(key: str, _: str = Depends(verify_token)):
 
 @router.put("/{key}", response_model=SettingOut)
 async def update_setting(key: str, data: SettingUpdate, _: str = Depends(verify_token)):
-    result = supabase.table("settings").update(
+    result = await execute(table("settings").update(
         {"value": data.value}
-    ).eq("key", key).execute()
+    ).eq("key", key))
     if not result.data:
         raise HTTPException(status_code=404, detail="Setting not found")
+    await settings_cache.set(key, data.value)
     return result.data[0]
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from enum import Enum
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
 
@@ -77,9 +77,41 @@ class RecordingOut(BaseModel):
     created_at: datetime
 
 
+class UploadCreate(RecordingCreate):
+    # Один ключ — одна запись: например, file_unique_id Telegram или sha256 файла
+    idempotency_key: str
+    size: Optional[int] = None
+
+
+class UploadStatus(str, Enum):
+    open = "open"
+    done = "done"
+
+
+class UploadOut(BaseModel):
+    id: str
+    offset: int
+    size: Optional[int] = None
+    status: UploadStatus
+    recording: Optional[RecordingOut] = None
+
+
+class RecordingStage(str, Enum):
+    compressed = "compressed"
+    transcribed = "transcribed"
+    analyzed = "analyzed"
+
+
 class RecordingStatusOut(BaseModel):
     id: str
     status: RecordingStatus
+    stage: Optional[RecordingStage] = None
+    error: Optional[str] = None
+
+
+class RetryResult(BaseModel):
+    retried: list[str]
+    skipped: list[str]
 
 
 # --- Client ---
@@ -146,6 +178,42 @@ class SettingOut(BaseModel):
     updated_at: datetime
 
 
+# --- Reanalysis ---
+
+class PromptKey(str, Enum):
+    prompt_teacher = "prompt_teacher"
+    prompt_sales = "prompt_sales"
+
+
+class ReanalysisStatus(str, Enum):
+    running = "running"
+    cancelled = "cancelled"
+    done = "done"
+    failed = "failed"
+
+
+class ReanalysisCreate(BaseModel):
+    prompt_key: PromptKey
+    city: Optional[City] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+
+
+class ReanalysisOut(BaseModel):
+    id: str
+    prompt_key: PromptKey
+    city: Optional[City] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    status: ReanalysisStatus
+    total: int
+    processed: int
+    failed: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+
 # --- Analytics ---
 
 class ConversionStats(BaseModel):
@@ -0,0 +1,90 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from app.config import ANALYTICS_CACHE_SIZE, ANALYTICS_CACHE_TTL
+from app.schemas import AnalyticsOut
+
+CacheKey = tuple[str, str, str]  # (city, date_from, date_to)
+
+
+class AnalyticsCache:
+    """LRU/TTL-кэш ответов /api/analytics с объединением одинаковых запросов.
+
+    Пока значение считается, параллельные запросы с тем же ключом ждут
+    одну и ту же задачу. Инвалидация по городу увеличивает поколение города:
+    результат, начатый до инвалидации, в кэш уже не попадёт.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[CacheKey, tuple[float, AnalyticsOut]] = OrderedDict()
+        self._inflight: dict[CacheKey, asyncio.Task] = {}
+        self._generations: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    async def get_or_compute(
+        self, key: CacheKey, compute: Callable[[], Awaitable[AnalyticsOut]]
+    ) -> AnalyticsOut:
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # Отдельная задача: отмена первого запроса не обрывает расчёт для остальных
+            task = asyncio.create_task(self._compute(key, compute))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: CacheKey, compute: Callable[[], Awaitable[AnalyticsOut]]) -> AnalyticsOut:
+        city = key[0]
+        generation = self._generations.get(city, 0)
+        try:
+            value = await compute()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+        if self._generations.get(city, 0) == generation:
+            self._store(key, value)
+        return value
+
+    def _store(self, key: CacheKey, value: AnalyticsOut):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_city(self, city: str):
+        """Сбрасывает все периоды города (запись готова, клиент изменён или удалён)."""
+        self._generations[city] = self._generations.get(city, 0) + 1
+        for key in [k for k in self._entries if k[0] == city]:
+            del self._entries[key]
+        for key in [k for k in self._inflight if k[0] == city]:
+            del self._inflight[key]
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+        }
+
+
+analytics_cache = AnalyticsCache(ANALYTICS_CACHE_SIZE, ANALYTICS_CACHE_TTL)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from typing import Callable, Optional
+from app.config import EVENT_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+Event = dict
+Predicate = Callable[[Event], bool]
+
+
+class Subscription:
+    """Очередь событий одного подписчика.
+
+    Очередь ограничена: медленный подписчик теряет самые старые события
+    и не тормозит издателя.
+    """
+
+    def __init__(self, bus: "EventBus", predicate: Optional[Predicate], maxsize: int):
+        self._bus = bus
+        self._predicate = predicate
+        self._queue: asyncio.Queue[Event] = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def _offer(self, event: Event):
+        if self._predicate and not self._predicate(event):
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(event)
+
+    async def get(self) -> Event:
+        return await self._queue.get()
+
+    def close(self):
+        self._bus._subscribers.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventBus:
+    """Внутрипроцессная шина событий (статусы записей и т.п.).
+
+    Событие — dict с ключом "type". Доставка только подписчикам этого
+    процесса API.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: set[Subscription] = set()
+        self.published = 0
+
+    def publish(self, event: Event):
+        self.published += 1
+        for sub in list(self._subscribers):
+            try:
+                sub._offer(event)
+            except Exception:
+                logger.exception("Event subscriber failed")
+
+    def subscribe(self, predicate: Optional[Predicate] = None) -> Subscription:
+        sub = Subscription(self, predicate, self.queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "subscribers": len(self._subscribers),
+            "dropped": sum(s.dropped for s in self._subscribers),
+        }
+
+
+event_bus = EventBus(EVENT_QUEUE_SIZE)
+
+
+def recording_event(recording_id: str, status: str, city: str, **fields) -> Event:
+    return {"type": "recording", "recording_id": recording_id, "status": status, "city": city, **fields}
+
+
+def client_event(action: str, client_id: str, city: str, **fields) -> Event:
+    return {"type": "client", "action": action, "client_id": client_id, "city": city, **fields}
@@ -0,0 +1,104 @@
+import asyncio
+from typing import AsyncIterable, AsyncIterator, Optional
+from app.config import FFMPEG_TIMEOUT
+
+CHUNK_SIZE = 64 * 1024
+# Из stderr хранится только хвост: при ошибке важны последние строки
+STDERR_LIMIT = 64 * 1024
+
+
+class FFmpegError(RuntimeError):
+    pass
+
+
+async def _read_tail(stream: asyncio.StreamReader, limit: int) -> bytes:
+    buf = bytearray()
+    while chunk := await stream.read(CHUNK_SIZE):
+        buf += chunk
+        if len(buf) > limit:
+            del buf[:len(buf) - limit]
+    return bytes(buf)
+
+
+async def _feed(stdin: asyncio.StreamWriter, source: AsyncIterable[bytes]):
+    try:
+        async for chunk in source:
+            stdin.write(chunk)
+            await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg завершился раньше, чем закончился вход; код возврата скажет почему
+        pass
+    finally:
+        stdin.close()
+
+
+async def stream_ffmpeg(
+    args: list[str],
+    source: Optional[AsyncIterable[bytes]] = None,
+    timeout: float = FFMPEG_TIMEOUT,
+) -> AsyncIterator[bytes]:
+    """Запускает ffmpeg и отдаёт stdout чанками.
+
+    source — поток входных чанков для "-i pipe:0" (иначе вход — файл из args).
+    Если выход в args — файл, генератор ничего не отдаёт. Ни вход, ни выход,
+    ни stderr целиком в памяти не держатся. При превышении timeout процесс
+    убивается.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", *args,
+        stdin=asyncio.subprocess.PIPE if source is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr_task = asyncio.create_task(_read_tail(proc.stderr, STDERR_LIMIT))
+    feed_task = asyncio.create_task(_feed(proc.stdin, source)) if source is not None else None
+    try:
+        while chunk := await asyncio.wait_for(proc.stdout.read(CHUNK_SIZE), deadline - loop.time()):
+            yield chunk
+        await asyncio.wait_for(proc.wait(), max(deadline - loop.time(), 1))
+    except asyncio.TimeoutError:
+        raise FFmpegError(f"ffmpeg timed out after {timeout}s")
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if feed_task:
+            feed_task.cancel()
+            await asyncio.gather(feed_task, return_exceptions=True)
+        stderr = await stderr_task
+    if proc.returncode != 0:
+        raise FFmpegError(f"ffmpeg error: {stderr.decode(errors='replace')}")
+
+
+async def run_ffmpeg(
+    args: list[str],
+    source: Optional[AsyncIterable[bytes]] = None,
+    timeout: float = FFMPEG_TIMEOUT,
+):
+    """ffmpeg с выходом в файл: ждёт завершения, stdout не используется."""
+    async for _ in stream_ffmpeg(args, source, timeout):
+        pass
+
+
+async def probe_duration(path: str, timeout: float = 60) -> float:
+    """Длительность медиафайла (сек) через ffprobe."""
+    proc = await asyncio.create_subprocess_exec(
+        "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise FFmpegError(f"ffprobe timed out after {timeout}s")
+    if proc.returncode != 0:
+        raise FFmpegError(f"ffprobe error: {stderr[-STDERR_LIMIT:].decode(errors='replace')}")
+    try:
+        return float(stdout.strip())
+    except ValueError:
+        raise FFmpegError(f"ffprobe returned no duration for {path}")
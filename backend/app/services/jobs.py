@@ -0,0 +1,399 @@
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+from app.config import (
+    SPOOL_DIR, JOB_HEARTBEAT_INTERVAL, JOB_STALE_AFTER,
+    JOB_MAX_ATTEMPTS, SHUTDOWN_DRAIN_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько хранить строки завершённых задач (вместе с аудио упавших)
+# и брошенные недокачанные файлы (сек)
+FINISHED_RETENTION = 7 * 24 * 3600
+PARTIAL_RETENTION = 24 * 3600
+
+JOB_COLUMNS = (
+    "id", "recording_id", "employee_role", "city", "audio_path", "audio_hash",
+    "status", "attempts", "worker_id", "heartbeat_at", "error", "created_at",
+)
+
+# Колонки, добавленные после первой версии таблицы: (имя, определение)
+MIGRATIONS = [
+    ("audio_hash", "TEXT"),
+]
+
+
+class JobQueue:
+    """Персистентная очередь обработки записей (SQLite + аудио в spool-каталоге).
+
+    Задача переживает рестарт: пока воркер её держит, он обновляет heartbeat,
+    а задачи с устаревшим heartbeat при старте возвращаются в очередь.
+    SQLite в режиме WAL позволяет нескольким процессам API разбирать
+    одну очередь.
+    """
+
+    def __init__(self, spool_dir: str):
+        self.spool_dir = Path(spool_dir)
+        self.audio_dir = self.spool_dir / "audio"
+        self.db_path = self.spool_dir / "jobs.sqlite3"
+        self._wakeup = asyncio.Event()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        self.audio_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    recording_id TEXT NOT NULL,
+                    employee_role TEXT NOT NULL,
+                    city TEXT NOT NULL,
+                    audio_path TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    heartbeat_at REAL,
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, definition in MIGRATIONS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+
+    async def open(self):
+        await asyncio.to_thread(self._init_db)
+
+    # --- Постановка ---
+
+    def new_upload_path(self) -> Path:
+        """Путь для приёма нового файла; enqueue переносит его в задачу."""
+        return self.audio_dir / f"{uuid.uuid4().hex}.part"
+
+    def _enqueue(
+        self, recording_id: str, employee_role: str, city: str,
+        upload_path: Optional[Path], audio_hash: Optional[str],
+    ) -> str:
+        job_id = uuid.uuid4().hex
+        audio_path = ""
+        if upload_path is not None:
+            audio_path = self.audio_dir / job_id
+            os.replace(upload_path, audio_path)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, recording_id, employee_role, city, audio_path, audio_hash, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, recording_id, employee_role, city, str(audio_path), audio_hash, time.time()),
+            )
+        return job_id
+
+    async def enqueue(
+        self, recording_id: str, employee_role: str, city: str,
+        upload_path: Optional[Path], audio_hash: Optional[str],
+    ) -> str:
+        """Ставит запись в очередь; без upload_path — задача без аудио
+        (повтор записи, у которой уже есть транскрипция)."""
+        job_id = await asyncio.to_thread(
+            self._enqueue, recording_id, employee_role, city, upload_path, audio_hash
+        )
+        self.wake()
+        return job_id
+
+    def wake(self):
+        self._wakeup.set()
+
+    # --- Разбор ---
+
+    def _claim(self, worker_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, heartbeat_at = ?,"
+                " attempts = attempts + 1 WHERE id = ?",
+                (worker_id, time.time(), row["id"]),
+            )
+            job = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (row["id"],)
+            ).fetchone()
+            conn.execute("COMMIT")
+        return dict(job)
+
+    async def claim(self, worker_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._claim, worker_id)
+
+    async def wait_for_job(self, timeout: float):
+        """Ждёт постановки новой задачи (или таймаута — на случай других процессов)."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    async def heartbeat(self, job_id: str):
+        await asyncio.to_thread(self._update, job_id, heartbeat_at=time.time())
+
+    async def requeue(self, job_id: str):
+        """Возвращает задачу в очередь (воркер остановлен, не доделав её)."""
+        await asyncio.to_thread(self._update, job_id, status="queued", worker_id=None)
+        self.wake()
+
+    @staticmethod
+    def _remove_files(audio_path: str):
+        """Удаляет аудио задачи и промежуточные файлы рядом с ним (<audio>.ogg и т.п.)."""
+        if not audio_path:
+            return
+        path = Path(audio_path)
+        for file in path.parent.glob(f"{path.name}*"):
+            file.unlink(missing_ok=True)
+
+    def _complete(self, job_id: str, audio_path: str):
+        self._update(job_id, status="done", error=None, heartbeat_at=time.time())
+        self._remove_files(audio_path)
+
+    async def complete(self, job: dict):
+        await asyncio.to_thread(self._complete, job["id"], job["audio_path"])
+
+    async def fail(self, job: dict, error: str):
+        """Аудио упавшей задачи сохраняется до purge_finished — для retry."""
+        await asyncio.to_thread(
+            self._update, job["id"], status="failed", error=error, heartbeat_at=time.time()
+        )
+
+    def _retry(self, recording_id: str) -> bool:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, audio_path FROM jobs WHERE recording_id = ? AND status = 'failed'"
+                " ORDER BY created_at DESC LIMIT 1",
+                (recording_id,),
+            ).fetchone()
+            if row is None or (row["audio_path"] and not Path(row["audio_path"]).exists()):
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, worker_id = NULL"
+                " WHERE id = ?",
+                (row["id"],),
+            )
+            conn.execute("COMMIT")
+        return True
+
+    async def retry(self, recording_id: str) -> bool:
+        """Возвращает в очередь последнюю упавшую задачу записи, если её аудио ещё на диске."""
+        retried = await asyncio.to_thread(self._retry, recording_id)
+        if retried:
+            self.wake()
+        return retried
+
+    def _has_job(self, recording_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM jobs WHERE recording_id = ? LIMIT 1", (recording_id,)
+            ).fetchone()
+        return row is not None
+
+    async def has_job(self, recording_id: str) -> bool:
+        """Есть ли у записи задача в любом статусе (упавшую повторяет retry)."""
+        return await asyncio.to_thread(self._has_job, recording_id)
+
+    # --- Восстановление и мониторинг ---
+
+    def _recover_stale(self, stale_after: float, max_attempts: int) -> tuple[list[str], list[dict]]:
+        """Возвращает в очередь задачи с протухшим heartbeat.
+
+        Задачи, исчерпавшие попытки (например, процесс падает на этом файле),
+        помечаются failed и возвращаются вторым списком; их аудио остаётся
+        для retry.
+        """
+        deadline = time.time() - stale_after
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs"
+                " WHERE status = 'running' AND heartbeat_at < ?",
+                (deadline,),
+            ).fetchall()
+            requeued, exhausted = [], []
+            for row in rows:
+                if row["attempts"] >= max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = 'stale: attempts exhausted'"
+                        " WHERE id = ?", (row["id"],),
+                    )
+                    exhausted.append(dict(row))
+                else:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', worker_id = NULL WHERE id = ?",
+                        (row["id"],),
+                    )
+                    requeued.append(row["recording_id"])
+            conn.execute("COMMIT")
+        return requeued, exhausted
+
+    async def recover_stale(self, stale_after: float = JOB_STALE_AFTER, max_attempts: int = JOB_MAX_ATTEMPTS):
+        requeued, exhausted = await asyncio.to_thread(self._recover_stale, stale_after, max_attempts)
+        if requeued:
+            logger.warning(f"Requeued {len(requeued)} stale jobs: {requeued}")
+            self.wake()
+        return exhausted
+
+    def _purge_finished(self, older_than: float):
+        deadline = time.time() - older_than
+        with self._connect() as conn:
+            failed = conn.execute(
+                "SELECT audio_path FROM jobs WHERE status = 'failed' AND heartbeat_at < ?",
+                (deadline,),
+            ).fetchall()
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND heartbeat_at < ?",
+                (deadline,),
+            )
+        for row in failed:
+            self._remove_files(row["audio_path"])
+        deadline = time.time() - PARTIAL_RETENTION
+        for path in self.audio_dir.glob("*.part"):
+            if path.stat().st_mtime < deadline:
+                path.unlink(missing_ok=True)
+
+    async def purge_finished(self, older_than: float = FINISHED_RETENTION):
+        await asyncio.to_thread(self._purge_finished, older_than)
+
+    def _counts(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, count(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    async def counts(self) -> dict:
+        return await asyncio.to_thread(self._counts)
+
+    async def free_bytes(self) -> int:
+        """Свободное место на диске spool."""
+        return (await asyncio.to_thread(shutil.disk_usage, self.spool_dir)).free
+
+
+class WorkerPool:
+    """Пул воркеров, разбирающих JobQueue. Масштабируется числом воркеров.
+
+    Отдельная задача периодически (и сразу при старте) возвращает в очередь
+    задачи, брошенные упавшими процессами; для задач, исчерпавших попытки,
+    вызывается on_exhausted.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[dict], Awaitable[None]],
+        size: int,
+        on_exhausted: Callable[[dict], Awaitable[None]],
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.size = size
+        self.on_exhausted = on_exhausted
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self.busy = 0
+
+    def start(self):
+        self._stopping.clear()
+        for i in range(self.size):
+            worker_id = f"{os.getpid()}-{i}"
+            self._tasks.append(asyncio.create_task(self._run(worker_id)))
+        self._tasks.append(asyncio.create_task(self._reap()))
+        logger.info(f"Started {self.size} pipeline workers")
+
+    async def _run(self, worker_id: str):
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.claim(worker_id)
+            except Exception:
+                logger.exception("Failed to claim job")
+                job = None
+            if job is None:
+                await self.queue.wait_for_job(timeout=JOB_HEARTBEAT_INTERVAL)
+                continue
+            await self._process(job)
+
+    async def _process(self, job: dict):
+        self.busy += 1
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            await self.handler(job)
+        except asyncio.CancelledError:
+            await self.queue.requeue(job["id"])
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job['id']} failed")
+            await self.queue.fail(job, repr(e))
+        else:
+            await self.queue.complete(job)
+        finally:
+            heartbeat.cancel()
+            self.busy -= 1
+
+    async def _reap(self):
+        while not self._stopping.is_set():
+            try:
+                for job in await self.queue.recover_stale():
+                    await self.on_exhausted(job)
+                await self.queue.purge_finished()
+            except Exception:
+                logger.exception("Stale job recovery failed")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), JOB_STALE_AFTER / 2)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await self.queue.heartbeat(job_id)
+            except Exception:
+                logger.exception(f"Heartbeat failed for job {job_id}")
+
+    async def stop(self, drain_timeout: float = SHUTDOWN_DRAIN_TIMEOUT):
+        """Не берёт новые задачи и ждёт текущие; недоделанные возвращает в очередь."""
+        self._stopping.set()
+        self.queue.wake()
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=drain_timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Pipeline workers stopped ({len(pending)} jobs requeued)")
+
+
+job_queue = JobQueue(SPOOL_DIR)
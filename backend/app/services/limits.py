@@ -0,0 +1,94 @@
+import asyncio
+from contextlib import asynccontextmanager
+from app.config import (
+    PIPELINE_MEMORY_BUDGET_MB, COMPRESS_CONCURRENCY, TRANSCRIBE_CONCURRENCY,
+    ANALYZE_CONCURRENCY,
+)
+
+
+class ByteBudget:
+    """Глобальный бюджет байт аудио, одновременно находящихся в памяти.
+
+    Файл больше всего бюджета допускается, только когда бюджет пуст,
+    иначе такой файл никогда не прошёл бы.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.waiting = 0
+        self._cond = asyncio.Condition()
+
+    def _fits(self, size: int) -> bool:
+        return self.used == 0 or self.used + size <= self.limit
+
+    async def acquire(self, size: int):
+        async with self._cond:
+            self.waiting += 1
+            try:
+                await self._cond.wait_for(lambda: self._fits(size))
+            finally:
+                self.waiting -= 1
+            self.used += size
+
+    async def release(self, size: int):
+        async with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        await self.acquire(size)
+        try:
+            yield
+        finally:
+            await self.release(size)
+
+    def stats(self) -> dict:
+        return {
+            "limit_bytes": self.limit,
+            "used_bytes": self.used,
+            "waiting": self.waiting,
+        }
+
+
+class StageLimit:
+    """Ограничение параллельности одного этапа pipeline со счётчиками."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(limit)
+
+    async def __aenter__(self):
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._sem.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting}
+
+
+memory_budget = ByteBudget(PIPELINE_MEMORY_BUDGET_MB * 1024 * 1024)
+
+compress_limit = StageLimit("compress", COMPRESS_CONCURRENCY)
+transcribe_limit = StageLimit("transcribe", TRANSCRIBE_CONCURRENCY)
+analyze_limit = StageLimit("analyze", ANALYZE_CONCURRENCY)
+
+
+def limits_stats() -> dict:
+    return {
+        "memory": memory_budget.stats(),
+        "stages": {
+            s.name: s.stats() for s in (compress_limit, transcribe_limit, analyze_limit)
+        },
+    }
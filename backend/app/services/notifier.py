@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import httpx
+from app.database import execute, table, projection
+from app.config import BOT_WEBHOOK_URL, BOT_WEBHOOK_SECRET
+from app.services.events import event_bus, Subscription
+
+logger = logging.getLogger(__name__)
+
+KZ_TZ = timezone(timedelta(hours=5))
+
+NOTIFY_COLUMNS = projection(
+    "id", "score", "analysis", "error",
+    "employees!inner(telegram_id)", "clients!inner(name, lesson_datetime)",
+    heavy=True,
+)
+# Попытки доставки в бота и длина краткого вывода в уведомлении
+DELIVERY_ATTEMPTS = 5
+SUMMARY_LIMIT = 700
+
+
+def _summary(analysis: Optional[str]) -> str:
+    """Краткий вывод: текст после «Итоговая оценка», иначе начало анализа."""
+    if not analysis:
+        return ""
+    lines = analysis.strip().splitlines()
+    tail = []
+    for i in range(len(lines) - 1, -1, -1):
+        if "итоговая оценка" in lines[i].lower():
+            tail = lines[i + 1:]
+            break
+    text = "\n".join(tail).strip() or analysis.strip()
+    text = re.sub(r"[*#]+", "", text)
+    if len(text) > SUMMARY_LIMIT:
+        text = text[:SUMMARY_LIMIT].rsplit(" ", 1)[0] + "…"
+    return text
+
+
+class BotNotifier:
+    """Отправляет боту завершение обработки записи (done/error).
+
+    Бот сам ставит сообщение сотруднику в свою очередь отправки
+    с учётом лимитов Telegram. Без BOT_WEBHOOK_URL или BOT_WEBHOOK_SECRET выключен.
+    """
+
+    def __init__(self, url: str, secret: str):
+        self.url = url
+        self.secret = secret
+        self._http: Optional[httpx.AsyncClient] = None
+        self._sub: Optional[Subscription] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        if not self.url:
+            return
+        if not self.secret:
+            # Бот без секрета не принимает события — не шлём их впустую
+            logger.warning("BOT_WEBHOOK_SECRET is not set, bot notifications are disabled")
+            return
+        self._http = httpx.AsyncClient(
+            timeout=10, headers={"X-Webhook-Secret": self.secret},
+        )
+        self._sub = event_bus.subscribe(
+            lambda e: e["type"] == "recording" and e["status"] in ("done", "error")
+        )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._sub:
+            self._sub.close()
+        if self._http:
+            await self._http.aclose()
+        self._task = self._sub = self._http = None
+
+    async def _run(self):
+        while True:
+            event = await self._sub.get()
+            try:
+                await self._deliver(event)
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Notification for recording {event['recording_id']} failed")
+
+    async def _deliver(self, event: dict):
+        rec = await execute(table("recordings").select(NOTIFY_COLUMNS).eq("id", event["recording_id"]))
+        if not rec.data:
+            return
+        recording = rec.data[0]
+        lesson_dt = datetime.fromisoformat(recording["clients"]["lesson_datetime"]).astimezone(KZ_TZ)
+        payload = {
+            "telegram_id": recording["employees"]["telegram_id"],
+            "recording_id": recording["id"],
+            "status": event["status"],
+            "client_name": recording["clients"]["name"],
+            "lesson_datetime": lesson_dt.strftime("%d.%m.%Y %H:%M"),
+            "score": recording["score"],
+            "summary": _summary(recording["analysis"]) if event["status"] == "done" else "",
+        }
+        for attempt in range(DELIVERY_ATTEMPTS):
+            try:
+                response = await self._http.post(self.url, json=payload)
+                response.raise_for_status()
+                self.sent += 1
+                return
+            except httpx.HTTPError as e:
+                if attempt == DELIVERY_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"Bot webhook failed ({e!r}), retry {attempt + 1}")
+                await asyncio.sleep(2 ** attempt)
+
+    def stats(self) -> dict:
+        return {"enabled": bool(self.url), "sent": self.sent, "failed": self.failed}
+
+
+bot_notifier = BotNotifier(BOT_WEBHOOK_URL, BOT_WEBHOOK_SECRET)
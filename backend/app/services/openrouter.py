@@ -1,12 +1,158 @@
-import httpx
+import asyncio
 import base64
-from app.config import OPENROUTER_API_KEY
+import logging
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import httpx
+from app.config import (
+    OPENROUTER_API_KEY, OPENROUTER_POOL_SIZE, OPENROUTER_MAX_RETRIES,
+    OPENROUTER_BACKOFF_BASE, OPENROUTER_BACKOFF_MAX,
+)
+
+logger = logging.getLogger(__name__)
 
 OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
 
 STT_MODEL = "google/gemini-2.5-flash"
 ANALYSIS_MODEL = "google/gemini-2.5-flash"
 
+STT_PROMPT = (
+    "Транскрибируй это аудио. Выведи только текст разговора, без комментариев. "
+    "Если есть несколько говорящих, обозначь их как Говорящий 1, Говорящий 2 и т.д."
+)
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+# По скольким последним запросам считаются перцентили задержки
+LATENCY_WINDOW = 500
+
+
+class ModelStats:
+    """Счётчики запросов к одной модели для /api/metrics."""
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.status_counts: dict[str, int] = {}
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, status: str, latency: float):
+        self.requests += 1
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        self.latencies.append(latency)
+
+    def stats(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(int(len(ordered) * p), len(ordered) - 1)], 3)
+
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "errors": self.errors,
+            "statuses": self.status_counts,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "latency_max": round(ordered[-1], 3) if ordered else None,
+        }
+
+
+_client: Optional[httpx.AsyncClient] = None
+_stats: dict[str, ModelStats] = {}
+
+
+async def open_client():
+    """Создаёт общий для приложения HTTP/2-клиент OpenRouter с пулом соединений."""
+    global _client
+    if _client is not None:
+        return
+    _client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=OPENROUTER_POOL_SIZE,
+            max_keepalive_connections=OPENROUTER_POOL_SIZE,
+        ),
+        headers={"Authorization": f"Bearer {OPENROUTER_API_KEY}"},
+    )
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("OpenRouter client is not open, call open_client() on startup")
+    return _client
+
+
+def openrouter_stats() -> dict:
+    return {model: s.stats() for model, s in _stats.items()}
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Retry-After в секундах (заголовок бывает числом или HTTP-датой)."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+    """Экспоненциальная задержка с полным джиттером; Retry-After — нижняя граница."""
+    delay = random.uniform(0, min(OPENROUTER_BACKOFF_MAX, OPENROUTER_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, OPENROUTER_BACKOFF_MAX))
+    return delay
+
+
+async def _complete(payload: dict, timeout: float) -> dict:
+    """POST в OpenRouter с повторами на 429/5xx и сетевые ошибки."""
+    model = payload["model"]
+    stats = _stats.setdefault(model, ModelStats())
+    client = _get_client()
+    for attempt in range(OPENROUTER_MAX_RETRIES + 1):
+        started = time.monotonic()
+        retry_after = None
+        try:
+            response = await client.post(OPENROUTER_URL, json=payload, timeout=timeout)
+        except httpx.TransportError as e:
+            stats.record(type(e).__name__, time.monotonic() - started)
+            if attempt == OPENROUTER_MAX_RETRIES:
+                stats.errors += 1
+                raise
+            error = repr(e)
+        else:
+            stats.record(str(response.status_code), time.monotonic() - started)
+            if response.status_code not in RETRY_STATUSES or attempt == OPENROUTER_MAX_RETRIES:
+                if response.is_error:
+                    stats.errors += 1
+                response.raise_for_status()
+                return response.json()
+            retry_after = _retry_after(response)
+            error = f"HTTP {response.status_code}"
+        delay = _backoff(attempt, retry_after)
+        stats.retries += 1
+        logger.warning(f"OpenRouter {model}: {error}, retry {attempt + 1} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
 
 async def transcribe_audio(audio_bytes: bytes, mime_type: str = "audio/ogg") -> str:
     """Транскрибация аудио через мультимодальную модель на OpenRouter."""
@@ -20,7 +166,7 @@ async def transcribe_audio(audio_bytes: bytes, mime_type: str = "audio/ogg") ->
                 "content": [
                     {
                         "type": "text",
-                        "text": "Транскрибируй это аудио. Выведи только текст разговора, без комментариев. Если есть несколько говорящих, обозначь их как Говорящий 1, Говорящий 2 и т.д.",
+                        "text": STT_PROMPT,
                     },
                     {
                         "type": "input_audio",
@@ -34,18 +180,8 @@ async def transcribe_audio(audio_bytes: bytes, mime_type: str = "audio/ogg") ->
         ],
     }
 
-    async with httpx.AsyncClient(timeout=300) as client:
-        response = await client.post(
-            OPENROUTER_URL,
-            json=payload,
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json",
-            },
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"]
+    data = await _complete(payload, timeout=300)
+    return data["choices"][0]["message"]["content"]
 
 
 async def analyze_transcription(transcription: str, prompt: str) -> dict:
@@ -64,18 +200,8 @@ async def analyze_transcription(transcription: str, prompt: str) -> dict:
         ],
     }
 
-    async with httpx.AsyncClient(timeout=120) as client:
-        response = await client.post(
-            OPENROUTER_URL,
-            json=payload,
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json",
-            },
-        )
-        response.raise_for_status()
-        data = response.json()
-        content = data["choices"][0]["message"]["content"]
+    data = await _complete(payload, timeout=120)
+    content = data["choices"][0]["message"]["content"]
 
     # Извлекаем оценку из последней строки
     score = 5  # дефолт
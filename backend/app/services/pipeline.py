@@ -1,74 +1,242 @@
-import asyncio
 import logging
-import traceback
-from app.database import supabase
-from app.services.openrouter import transcribe_audio, analyze_transcription
+import os
+from pathlib import Path
+from typing import AsyncIterable, Optional, Union
+from app.database import execute, table, projection
+from app.services.openrouter import analyze_transcription
+from app.services.transcription import transcribe_recording
+from app.services.ffmpeg import run_ffmpeg
+from app.services.silence import SpeechSegment, TimeMap, detect_speech, select_filter
+from app.services.spool import file_sha256
+from app.services import result_cache
+from app.services.result_cache import text_hash
+from app.services.analytics_cache import analytics_cache
+from app.services.settings_cache import settings_cache
+from app.services.events import event_bus, recording_event
+from app.services.jobs import job_queue, WorkerPool
+from app.services.limits import compress_limit, analyze_limit
+from app.config import PIPELINE_WORKERS, TRIM_SILENCE
 
 logger = logging.getLogger(__name__)
 
+TRANSCRIPTION_COLUMNS = projection("transcription", heavy=True)
 
-async def compress_audio(audio_bytes: bytes) -> bytes:
-    """Сжимает аудио в mono 32kbps OGG через ffmpeg для экономии токенов API."""
-    proc = await asyncio.create_subprocess_exec(
-        "ffmpeg", "-i", "pipe:0",
-        "-ac", "1",           # mono
-        "-b:a", "32k",        # 32 kbps
-        "-map", "0:a",        # только аудио
-        "-f", "ogg",          # формат
-        "pipe:1",
-        stdin=asyncio.subprocess.PIPE,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+
+async def compress_audio(
+    source: Union[str, AsyncIterable[bytes]],
+    output_path: str,
+    audio_filter: Optional[str] = None,
+):
+    """Сжимает аудио в mono 32kbps OGG через ffmpeg для экономии токенов API.
+
+    Вход — путь к файлу или поток чанков, выход пишется в файл: потребление
+    памяти не зависит от длины записи. audio_filter — дополнительный -af
+    (например, вырезание тишины).
+    """
+    input_arg = source if isinstance(source, str) else "pipe:0"
+    filter_args = ["-af", audio_filter] if audio_filter else []
+    await run_ffmpeg(
+        [
+            "-y", "-i", input_arg,
+            *filter_args,
+            "-ac", "1",           # mono
+            "-b:a", "32k",        # 32 kbps
+            "-map", "0:a",        # только аудио
+            "-f", "ogg",          # формат
+            output_path,
+        ],
+        source=None if isinstance(source, str) else source,
     )
-    stdout, stderr = await proc.communicate(input=audio_bytes)
-    if proc.returncode != 0:
-        raise RuntimeError(f"ffmpeg error: {stderr.decode()}")
-    return stdout
 
 
-async def process_recording(recording_id: str, employee_role: str, audio_bytes: bytes):
-    """Фоновый pipeline: сжатие → транскрибация → анализ → сохранение."""
+async def process_recording(
+    recording_id: str, employee_role: str, city: str, audio_path: str, audio_hash: Optional[str] = None
+):
+    """Фоновый pipeline: сжатие → транскрибация → анализ → сохранение.
+
+    Завершённый этап отмечается в recordings.stage (compressed → transcribed →
+    analyzed), и повторный запуск — retry или возврат задачи в очередь —
+    начинается с первого незавершённого. Ошибка пробрасывается в очередь,
+    чтобы та сохранила аудио для повтора.
+    """
+    # client_id и роль в событиях — чтобы подписчик обновил нужную карточку
+    fields = {"role": employee_role}
     try:
-        # 1. Обновляем статус
-        supabase.table("recordings").update(
-            {"status": "transcribing"}
-        ).eq("id", recording_id).execute()
-
-        # 2. Сжимаем аудио перед отправкой в API
-        original_size = len(audio_bytes)
-        audio_bytes = await compress_audio(audio_bytes)
-        logger.info(f"Recording {recording_id}: compressed {original_size} -> {len(audio_bytes)} bytes")
-
-        # 3. Транскрибация
-        transcription = await transcribe_audio(audio_bytes)
-
-        supabase.table("recordings").update(
-            {"transcription": transcription, "status": "analyzing"}
-        ).eq("id", recording_id).execute()
-
-        # 4. Получаем промпт из настроек
-        prompt_key = "prompt_teacher" if employee_role == "teacher" else "prompt_sales"
-        setting = supabase.table("settings").select("value").eq(
-            "key", prompt_key
-        ).single().execute()
-        prompt = setting.data["value"]
-
-        # 5. Анализ
-        result = await analyze_transcription(transcription, prompt)
+        rec = await execute(table("recordings").select(
+            "stage, status, score, time_map, client_id"
+        ).eq("id", recording_id))
+        if not rec.data:
+            logger.warning(f"Recording {recording_id} was deleted, skipping")
+            return
+        stage = rec.data[0]["stage"]
+        fields["client_id"] = rec.data[0]["client_id"]
+        if stage == "analyzed":
+            # Анализ сохранён, но статус мог остаться error (задачу признали
+            # протухшей уже после записи результата) — возвращаем done
+            if rec.data[0]["status"] != "done":
+                await execute(table("recordings").update(
+                    {"status": "done", "error": None}
+                ).eq("id", recording_id))
+                analytics_cache.invalidate_city(city)
+                event_bus.publish(recording_event(
+                    recording_id, "done", city, score=rec.data[0]["score"], **fields
+                ))
+            return
+
+        # 1-2. Сжатие и транскрибация (если ещё не сделаны)
+        if stage == "transcribed":
+            saved = await execute(table("recordings").select(TRANSCRIPTION_COLUMNS).eq("id", recording_id))
+            transcription = saved.data[0]["transcription"]
+        else:
+            transcription = await transcription_stage(
+                recording_id, city, audio_path, audio_hash, stage, rec.data[0]["time_map"], fields
+            )
 
-        supabase.table("recordings").update({
+        # 3. Получаем промпт из настроек
+        prompt = await get_prompt(prompt_key_for(employee_role))
+
+        # 4. Анализ
+        await set_status(recording_id, "analyzing", city, **fields)
+        result = await analyze(recording_id, transcription, prompt)
+
+        await execute(table("recordings").update({
             "analysis": result["analysis"],
             "score": result["score"],
+            "prompt_hash": text_hash(prompt),
+            "stage": "analyzed",
             "status": "done",
-        }).eq("id", recording_id).execute()
+            "error": None,
+        }).eq("id", recording_id))
+        analytics_cache.invalidate_city(city)
+        event_bus.publish(recording_event(recording_id, "done", city, score=result["score"], **fields))
 
     except Exception as e:
-        traceback.print_exc()
-        supabase.table("recordings").update(
-            {"status": "error"}
-        ).eq("id", recording_id).execute()
+        await mark_failed(recording_id, city, repr(e), **fields)
+        raise
+
+
+async def transcription_stage(
+    recording_id: str,
+    city: str,
+    audio_path: str,
+    audio_hash: Optional[str],
+    stage: Optional[str],
+    time_map: Optional[list],
+    fields: dict,
+) -> str:
+    """Сжатие и транскрибация с контрольными точками на строке записи."""
+    await set_status(recording_id, "transcribing", city, **fields)
+
+    # Тот же файл уже транскрибировали (пересылка, повторная отправка) —
+    # берём готовую транскрипцию без ffmpeg и STT
+    audio_hash = audio_hash or await file_sha256(audio_path)
+    cached = await result_cache.get_transcription(audio_hash)
+    compressed_path = f"{audio_path}.ogg"
+    if cached:
+        logger.info(f"Recording {recording_id}: transcription cache hit")
+        transcription, time_map = cached["transcription"], cached["time_map"]
+    else:
+        # Сжатый файл от прошлой попытки переиспользуется
+        if stage != "compressed" or not os.path.exists(compressed_path):
+            time_map = await compress(recording_id, audio_path, compressed_path)
+            await execute(table("recordings").update(
+                {"stage": "compressed", "time_map": time_map}
+            ).eq("id", recording_id))
+        # Длинные записи — по частям параллельно
+        transcription = await transcribe_recording(recording_id, compressed_path)
+        await result_cache.put_transcription(audio_hash, transcription, time_map)
+
+    await execute(table("recordings").update(
+        {"transcription": transcription, "time_map": time_map, "stage": "transcribed"}
+    ).eq("id", recording_id))
+    Path(compressed_path).unlink(missing_ok=True)
+    return transcription
+
+
+def prompt_key_for(employee_role: str) -> str:
+    return "prompt_teacher" if employee_role == "teacher" else "prompt_sales"
+
+
+async def get_prompt(prompt_key: str, refresh: bool = False) -> str:
+    return await settings_cache.prompt(prompt_key, refresh)
+
+
+async def analyze(recording_id: str, transcription: str, prompt: str) -> dict:
+    """Анализ транскрипции; та же транскрипция с тем же промптом — из кэша."""
+    result = await result_cache.get_analysis(transcription, prompt)
+    if result:
+        logger.info(f"Recording {recording_id}: analysis cache hit")
+        return result
+    async with analyze_limit:
+        result = await analyze_transcription(transcription, prompt)
+    await result_cache.put_analysis(transcription, prompt, result)
+    return result
+
+
+async def compress(recording_id: str, audio_path: str, compressed_path: str) -> Optional[list]:
+    """Сжимает аудио перед отправкой в API (файл → файл рядом в spool), при
+    включённом TRIM_SILENCE — без длинных пауз. Возвращает карту времени или None.
+
+    Файл появляется под итоговым именем только целиком, поэтому оборванное
+    сжатие не будет принято за готовое.
+    """
+    partial_path = f"{compressed_path}.part"
+    original_size = os.path.getsize(audio_path)
+    async with compress_limit:
+        speech = await trim_silence(recording_id, audio_path) if TRIM_SILENCE else None
+        await compress_audio(audio_path, partial_path, select_filter(speech) if speech else None)
+    os.replace(partial_path, compressed_path)
+    compressed_size = os.path.getsize(compressed_path)
+    logger.info(f"Recording {recording_id}: compressed {original_size} -> {compressed_size} bytes")
+    return TimeMap.from_speech(speech).as_json() if speech else None
+
+
+async def trim_silence(recording_id: str, audio_path: str) -> Optional[list[SpeechSegment]]:
+    """Находит участки речи, которые останутся после вырезания тишины.
+
+    По ним строится фильтр ffmpeg и карта времени (time_map), переводящая
+    таймкоды обрезанного аудио в таймкоды исходной записи. Если вырезать
+    нечего — возвращает None.
+    """
+    speech, duration = await detect_speech(audio_path)
+    kept = sum(s.end - s.start for s in speech)
+    removed = duration - kept
+    if not speech or removed < 1:
+        logger.info(f"Recording {recording_id}: no silence to trim ({duration:.0f}s)")
+        return None
+    logger.info(
+        f"Recording {recording_id}: trimmed {removed:.0f}s of {duration:.0f}s "
+        f"({removed / duration:.0%}) silence"
+    )
+    return speech
+
+
+async def run_job(job: dict):
+    """Обработчик задачи из очереди: аудио лежит в spool-каталоге."""
+    await process_recording(
+        job["recording_id"], job["employee_role"], job["city"], job["audio_path"], job["audio_hash"]
+    )
+
+
+async def set_status(recording_id: str, status: str, city: str, **fields):
+    await execute(table("recordings").update(
+        {"status": status}
+    ).eq("id", recording_id))
+    event_bus.publish(recording_event(recording_id, status, city, **fields))
+
+
+async def mark_failed(recording_id: str, city: str, error: str, **fields):
+    await execute(table("recordings").update(
+        {"status": "error", "error": error}
+    ).eq("id", recording_id))
+    event_bus.publish(recording_event(recording_id, "error", city, **fields))
+
+
+async def on_job_exhausted(job: dict):
+    """Задача несколько раз обрывалась вместе с процессом — запись в ошибку."""
+    await mark_failed(
+        job["recording_id"], job["city"], "stale: attempts exhausted", role=job["employee_role"]
+    )
 
 
-def run_pipeline_background(recording_id: str, employee_role: str, audio_bytes: bytes):
-    """Запускает pipeline в фоне."""
-    asyncio.create_task(process_recording(recording_id, employee_role, audio_bytes))
+worker_pool = WorkerPool(job_queue, run_job, PIPELINE_WORKERS, on_exhausted=on_job_exhausted)
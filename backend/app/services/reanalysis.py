@@ -0,0 +1,267 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from app.database import execute, table, projection
+from app.config import (
+    REANALYSIS_CONCURRENCY, REANALYSIS_BATCH, JOB_HEARTBEAT_INTERVAL, JOB_STALE_AFTER,
+)
+from app.services.analytics_cache import analytics_cache
+from app.services.pipeline import TRANSCRIPTION_COLUMNS, get_prompt, analyze
+from app.services.result_cache import text_hash
+
+logger = logging.getLogger(__name__)
+
+PROMPT_ROLES = {"prompt_teacher": "teacher", "prompt_sales": "sales_manager"}
+
+RUN_COLUMNS = projection(
+    "id", "prompt_key", "city", "date_from", "date_to", "prompt_hash", "status",
+    "total", "processed", "failed", "error", "created_at", "updated_at",
+)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ReanalysisConflict(Exception):
+    """Уже идёт запуск того же промпта по пересекающейся выборке."""
+
+    def __init__(self, run: dict):
+        super().__init__(f"Reanalysis {run['id']} is already running")
+        self.run = run
+
+
+def _overlaps(run: dict, city: Optional[str], date_from: Optional[date], date_to: Optional[date]) -> bool:
+    """Пересекаются ли выборки: город и границы периода None — «любые»."""
+    if run["city"] and city and run["city"] != city:
+        return False
+    run_from = date.fromisoformat(run["date_from"]) if run["date_from"] else date.min
+    run_to = date.fromisoformat(run["date_to"]) if run["date_to"] else date.max
+    return run_from <= (date_to or date.max) and (date_from or date.min) <= run_to
+
+
+class ReanalysisRunner:
+    """Фоновый переанализ готовых записей после смены промпта.
+
+    Повторяется только анализ по сохранённой транскрипции — STT не вызывается.
+    Запуск хранится в таблице reanalysis_runs; у каждой записи сохраняется
+    хэш промпта, которым получена оценка, поэтому обработанные записи
+    из выборки выпадают, и после рестарта запуск продолжается с того же места.
+    Пока запуск идёт, обновляется heartbeat; запуск с протухшим heartbeat
+    подхватывается заново (в том числе другим процессом).
+    """
+
+    def __init__(self, concurrency: int, batch_size: int):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._watcher: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        # Проверка пересечения и вставка запуска — атомарно в пределах процесса
+        self._create_lock = asyncio.Lock()
+
+    def start(self):
+        self._stopping.clear()
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        """Останавливает локальные запуски; в базе они остаются running и продолжатся."""
+        self._stopping.set()
+        tasks = list(self._tasks.values())
+        if self._watcher:
+            tasks.append(self._watcher)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._watcher = None
+
+    # --- API ---
+
+    async def create(
+        self, prompt_key: str, city: Optional[str], date_from: Optional[date], date_to: Optional[date]
+    ) -> dict:
+        """Новый запуск. Если тот же промпт уже переанализирует пересекающуюся
+        выборку — ReanalysisConflict: одни и те же записи оценивались бы дважды."""
+        async with self._create_lock:
+            running = await execute(table("reanalysis_runs").select(RUN_COLUMNS).eq(
+                "prompt_key", prompt_key
+            ).eq("status", "running"))
+            for run in running.data:
+                if _overlaps(run, city, date_from, date_to):
+                    raise ReanalysisConflict(run)
+            result = await execute(table("reanalysis_runs").insert({
+                "prompt_key": prompt_key,
+                "city": city,
+                "date_from": date_from.isoformat() if date_from else None,
+                "date_to": date_to.isoformat() if date_to else None,
+                "heartbeat_at": _now(),
+            }))
+        run = result.data[0]
+        self._launch(run)
+        return run
+
+    async def get(self, run_id: str) -> Optional[dict]:
+        result = await execute(table("reanalysis_runs").select(RUN_COLUMNS).eq("id", run_id))
+        return result.data[0] if result.data else None
+
+    async def recent(self, limit: int = 20) -> list[dict]:
+        result = await execute(
+            table("reanalysis_runs").select(RUN_COLUMNS).order("created_at", desc=True).limit(limit)
+        )
+        return result.data
+
+    async def cancel(self, run_id: str) -> Optional[dict]:
+        """Отмена: запуск в другом процессе заметит её по heartbeat."""
+        await execute(table("reanalysis_runs").update(
+            {"status": "cancelled", "updated_at": _now()}
+        ).eq("id", run_id).eq("status", "running"))
+        task = self._tasks.get(run_id)
+        if task:
+            task.cancel()
+        return await self.get(run_id)
+
+    # --- Выполнение ---
+
+    def _launch(self, run: dict):
+        run_id = run["id"]
+        task = asyncio.create_task(self._execute(run))
+        self._tasks[run_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(run_id, None))
+
+    async def _execute(self, run: dict):
+        heartbeat = asyncio.create_task(self._heartbeat(run["id"], asyncio.current_task()))
+        try:
+            await self._run(run)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Reanalysis {run['id']} failed")
+            await self._update(run["id"], status="failed", error=repr(e))
+        finally:
+            heartbeat.cancel()
+
+    def _pending(self, run: dict, columns: str, prompt_hash: str, count: Optional[str] = None):
+        """Готовые записи в рамках запуска, оценённые не текущим промптом."""
+        query = table("analytics_recordings").select(columns, count=count).eq(
+            "role", PROMPT_ROLES[run["prompt_key"]]
+        ).or_(f"prompt_hash.is.null,prompt_hash.neq.{prompt_hash}")
+        if run["city"]:
+            query = query.eq("city", run["city"])
+        if run["date_from"]:
+            query = query.gte("lesson_datetime", run["date_from"])
+        if run["date_to"]:
+            date_to = date.fromisoformat(run["date_to"]) + timedelta(days=1)
+            query = query.lt("lesson_datetime", date_to.isoformat())
+        return query
+
+    async def _run(self, run: dict):
+        # Промпт мог только что смениться в другом процессе — читаем из БД
+        prompt = await get_prompt(run["prompt_key"], refresh=True)
+        prompt_hash = text_hash(prompt)
+        counted = await execute(self._pending(run, "id", prompt_hash, count="exact").limit(1))
+        # Продолжение того же запуска с тем же промптом сохраняет прогресс
+        processed = run["processed"] if run["prompt_hash"] == prompt_hash else 0
+        failed = 0
+        await self._update(
+            run["id"], prompt_hash=prompt_hash, total=processed + (counted.count or 0),
+            processed=processed, failed=failed,
+        )
+        logger.info(f"Reanalysis {run['id']}: {counted.count} recordings to process")
+
+        sem = asyncio.Semaphore(self.concurrency)
+        last_id = None
+        while True:
+            # Keyset-пагинация: записи с ошибкой не выбираются повторно
+            query = self._pending(run, "id, city", prompt_hash).order("id").limit(self.batch_size)
+            if last_id:
+                query = query.gt("id", last_id)
+            rows = (await execute(query)).data
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            results = await asyncio.gather(
+                *(self._reanalyze(row["id"], prompt, prompt_hash, sem) for row in rows),
+                return_exceptions=True,
+            )
+            for row, result in zip(rows, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Reanalysis {run['id']}: recording {row['id']} failed: {result!r}")
+                    failed += 1
+                else:
+                    processed += 1
+            for city in {row["city"] for row in rows}:
+                analytics_cache.invalidate_city(city)
+            if not await self._update(run["id"], processed=processed, failed=failed):
+                return
+
+        await self._update(run["id"], status="done")
+        logger.info(f"Reanalysis {run['id']}: done, {processed} processed, {failed} failed")
+
+    async def _reanalyze(self, recording_id: str, prompt: str, prompt_hash: str, sem: asyncio.Semaphore):
+        async with sem:
+            rec = await execute(
+                table("recordings").select(TRANSCRIPTION_COLUMNS).eq("id", recording_id)
+            )
+            transcription = rec.data[0]["transcription"] if rec.data else None
+            if not transcription:
+                raise ValueError("Recording has no transcription")
+            result = await analyze(recording_id, transcription, prompt)
+            await execute(table("recordings").update({
+                "analysis": result["analysis"],
+                "score": result["score"],
+                "prompt_hash": prompt_hash,
+            }).eq("id", recording_id).eq("status", "done"))
+
+    async def _update(self, run_id: str, **fields) -> bool:
+        """Обновляет идущий запуск; False — запуск уже отменён."""
+        result = await execute(table("reanalysis_runs").update(
+            {**fields, "heartbeat_at": _now(), "updated_at": _now()}
+        ).eq("id", run_id).eq("status", "running"))
+        return bool(result.data)
+
+    async def _heartbeat(self, run_id: str, owner: asyncio.Task):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                alive = await self._update(run_id)
+            except Exception:
+                logger.exception(f"Heartbeat failed for reanalysis {run_id}")
+                continue
+            if not alive:
+                logger.info(f"Reanalysis {run_id} cancelled")
+                owner.cancel()
+                return
+
+    # --- Продолжение после рестарта ---
+
+    async def _watch(self):
+        while not self._stopping.is_set():
+            try:
+                await self._resume_stale()
+            except Exception:
+                logger.exception("Reanalysis resume failed")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), JOB_STALE_AFTER / 2)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _resume_stale(self):
+        deadline = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_AFTER)
+        stale = await execute(
+            table("reanalysis_runs").select(f"{RUN_COLUMNS}, heartbeat_at")
+            .eq("status", "running").lt("heartbeat_at", deadline.isoformat())
+        )
+        for run in stale.data:
+            if run["id"] in self._tasks:
+                continue
+            # Забираем запуск, только если его не забрал другой процесс
+            claimed = await execute(table("reanalysis_runs").update(
+                {"heartbeat_at": _now()}
+            ).eq("id", run["id"]).eq("status", "running").eq("heartbeat_at", run["heartbeat_at"]))
+            if claimed.data:
+                logger.info(f"Resuming reanalysis {run['id']}")
+                self._launch(claimed.data[0])
+
+
+reanalysis_runner = ReanalysisRunner(REANALYSIS_CONCURRENCY, REANALYSIS_BATCH)
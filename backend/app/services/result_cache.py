@@ -0,0 +1,78 @@
+import hashlib
+import logging
+from typing import Optional
+from app.database import execute, table
+from app.services.openrouter import STT_MODEL, STT_PROMPT, ANALYSIS_MODEL
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+# Смена промпта STT должна инвалидировать кэш так же, как смена модели
+STT_PROMPT_HASH = text_hash(STT_PROMPT)
+
+
+async def get_transcription(audio_hash: str) -> Optional[dict]:
+    """Ранее полученная транскрипция того же аудио: {"transcription", "time_map"}.
+
+    Ошибка чтения кэша не должна ронять обработку — тогда просто промах.
+    """
+    try:
+        result = await execute(
+            table("transcription_cache").select("transcription, time_map")
+            .eq("audio_hash", audio_hash)
+            .eq("stt_model", STT_MODEL)
+            .eq("prompt_hash", STT_PROMPT_HASH)
+            .limit(1)
+        )
+    except Exception:
+        logger.exception("Transcription cache lookup failed")
+        return None
+    return result.data[0] if result.data else None
+
+
+async def put_transcription(audio_hash: str, transcription: str, time_map: Optional[list]):
+    try:
+        await execute(table("transcription_cache").upsert({
+            "audio_hash": audio_hash,
+            "stt_model": STT_MODEL,
+            "prompt_hash": STT_PROMPT_HASH,
+            "transcription": transcription,
+            "time_map": time_map,
+        }))
+    except Exception:
+        logger.exception("Transcription cache store failed")
+
+
+async def get_analysis(transcription: str, prompt: str) -> Optional[dict]:
+    """Ранее полученный анализ той же транскрипции тем же промптом и моделью:
+    {"analysis", "score"} — в том же виде, что возвращает analyze_transcription.
+    """
+    try:
+        result = await execute(
+            table("analysis_cache").select("analysis, score")
+            .eq("transcript_hash", text_hash(transcription))
+            .eq("prompt_hash", text_hash(prompt))
+            .eq("model", ANALYSIS_MODEL)
+            .limit(1)
+        )
+    except Exception:
+        logger.exception("Analysis cache lookup failed")
+        return None
+    return result.data[0] if result.data else None
+
+
+async def put_analysis(transcription: str, prompt: str, result: dict):
+    try:
+        await execute(table("analysis_cache").upsert({
+            "transcript_hash": text_hash(transcription),
+            "prompt_hash": text_hash(prompt),
+            "model": ANALYSIS_MODEL,
+            "analysis": result["analysis"],
+            "score": result["score"],
+        }))
+    except Exception:
+        logger.exception("Analysis cache store failed")
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+from app.database import execute, table
+from app.config import SETTINGS_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class SettingsCache:
+    """Таблица settings (промпты, пароль админки) в памяти процесса.
+
+    Загружается при старте целиком и обновляется при записи через
+    update_setting. TTL нужен на случай правки таблицы напрямую в БД
+    или через другой процесс API. Если перечитать не удалось, отдаются
+    прежние значения.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._values: dict[str, str] = {}
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.reloads = 0
+        self.reload_errors = 0
+
+    async def load(self):
+        async with self._lock:
+            await self._load()
+
+    async def _load(self):
+        result = await execute(table("settings").select("key, value"))
+        self._values = {row["key"]: row["value"] for row in result.data}
+        self._expires_at = time.monotonic() + self.ttl
+        self.reloads += 1
+
+    async def _refresh(self, force: bool):
+        async with self._lock:
+            # Пока ждали блокировку, другой запрос мог уже перечитать
+            if not force and time.monotonic() < self._expires_at:
+                return
+            try:
+                await self._load()
+            except Exception:
+                if not self._values:
+                    raise
+                self.reload_errors += 1
+                logger.exception("Settings reload failed, serving cached values")
+
+    async def get(self, key: str, refresh: bool = False) -> Optional[str]:
+        """Значение настройки; refresh=True — перечитать из БД прямо сейчас."""
+        if refresh or time.monotonic() >= self._expires_at:
+            await self._refresh(force=refresh)
+        else:
+            self.hits += 1
+        return self._values.get(key)
+
+    async def set(self, key: str, value: str):
+        """Write-through после успешной записи в БД.
+
+        Под той же блокировкой, что и перечитывание: чтение, начатое до
+        записи в БД, не затрёт новое значение старым.
+        """
+        async with self._lock:
+            self._values[key] = value
+
+    async def prompt(self, prompt_key: str, refresh: bool = False) -> str:
+        value = await self.get(prompt_key, refresh)
+        if value is None:
+            raise KeyError(f"Setting '{prompt_key}' not found")
+        return value
+
+    async def admin_password(self) -> Optional[str]:
+        return await self.get("admin_password")
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._values),
+            "hits": self.hits,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "ttl": self.ttl,
+        }
+
+
+settings_cache = SettingsCache(SETTINGS_CACHE_TTL)
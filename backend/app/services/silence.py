@@ -0,0 +1,96 @@
+import re
+from dataclasses import dataclass
+from app.config import SILENCE_NOISE_DB, SILENCE_MIN_DURATION, SILENCE_PADDING
+from app.services.ffmpeg import stream_ffmpeg, probe_duration
+
+_SILENCE_START = re.compile(r"lavfi\.silence_start=(-?[\d.]+)")
+_SILENCE_END = re.compile(r"lavfi\.silence_end=([\d.]+)")
+
+
+@dataclass
+class SpeechSegment:
+    """Участок исходной записи, который остаётся после вырезания тишины (сек)."""
+    start: float
+    end: float
+
+
+@dataclass
+class TimeMap:
+    """Соответствие времени в обрезанном аудио времени в исходной записи.
+
+    segments — список (начало в обрезанном, начало в исходном, длительность).
+    Карта сохраняется в recordings.time_map: время t в обрезанном аудио
+    из участка (s, o, длительность) соответствует o + (t - s) в исходной записи.
+    """
+    segments: list[tuple[float, float, float]]
+
+    @classmethod
+    def from_speech(cls, speech: list[SpeechSegment]) -> "TimeMap":
+        segments, offset = [], 0.0
+        for s in speech:
+            duration = s.end - s.start
+            segments.append((round(offset, 3), round(s.start, 3), round(duration, 3)))
+            offset += duration
+        return cls(segments)
+
+    def as_json(self) -> list[list[float]]:
+        return [list(seg) for seg in self.segments]
+
+
+async def detect_speech(
+    audio_path: str, min_silence: float = SILENCE_MIN_DURATION
+) -> tuple[list[SpeechSegment], float]:
+    """Находит участки речи через silencedetect. Возвращает (участки, длительность).
+
+    min_silence — минимальная длина паузы, считающейся тишиной (сек).
+    """
+    duration = await probe_duration(audio_path)
+    silences: list[tuple[float, float | None]] = []
+    tail = b""
+    args = [
+        "-i", audio_path,
+        "-map", "0:a",
+        "-af", (
+            f"silencedetect=n={SILENCE_NOISE_DB}dB:d={min_silence},"
+            "ametadata=mode=print:file=-"
+        ),
+        "-f", "null", "-",
+    ]
+    async for chunk in stream_ffmpeg(args):
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        for raw in lines:
+            line = raw.decode(errors="replace")
+            if m := _SILENCE_START.search(line):
+                silences.append((max(float(m.group(1)), 0.0), None))
+            elif (m := _SILENCE_END.search(line)) and silences and silences[-1][1] is None:
+                silences[-1] = (silences[-1][0], float(m.group(1)))
+
+    speech, position = [], 0.0
+    for start, end in silences:
+        end = duration if end is None else end
+        # Небольшой запас по краям, чтобы не обрезать начало и конец фраз
+        if start > position:
+            speech.append(SpeechSegment(
+                max(position - SILENCE_PADDING, 0.0), min(start + SILENCE_PADDING, duration),
+            ))
+        position = end
+    if duration > position:
+        speech.append(SpeechSegment(max(position - SILENCE_PADDING, 0.0), duration))
+    return _merge(speech), duration
+
+
+def _merge(speech: list[SpeechSegment]) -> list[SpeechSegment]:
+    merged: list[SpeechSegment] = []
+    for s in speech:
+        if merged and s.start <= merged[-1].end:
+            merged[-1].end = max(merged[-1].end, s.end)
+        else:
+            merged.append(SpeechSegment(s.start, s.end))
+    return merged
+
+
+def select_filter(speech: list[SpeechSegment]) -> str:
+    """Аудиофильтр ffmpeg, оставляющий только участки речи."""
+    ranges = "+".join(f"between(t,{s.start:.3f},{s.end:.3f})" for s in speech)
+    return f"aselect='{ranges}',asetpts=N/SR/TB"
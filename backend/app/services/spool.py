@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+from pathlib import Path
+from fastapi import HTTPException, Request
+from python_multipart.multipart import MultipartParser, MultipartParseError, parse_options_header
+from app.config import MAX_UPLOAD_MB
+
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+# Всё, кроме файла, в multipart-форме: заголовки частей и текстовые поля
+MAX_FORM_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class SpoolWriter:
+    """Пишет поток чанков в файл, считая размер и sha256 на лету."""
+
+    def __init__(self, path: Path, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = None
+
+    async def __aenter__(self):
+        self._file = await asyncio.to_thread(open, self.path, "ab")
+        return self
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        self._hash.update(chunk)
+        await asyncio.to_thread(self._file.write, chunk)
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    async def __aexit__(self, *exc):
+        await asyncio.to_thread(self._file.close)
+
+
+class _MultipartSpool:
+    """Колбэки потокового парсера multipart: данные поля-файла копятся до
+    записи в SpoolWriter (не больше одного чанка тела), остальные поля — в словарь."""
+
+    def __init__(self, file_field: str):
+        self.file_field = file_field
+        self.fields: dict[str, str] = {}
+        self.file_seen = False
+        self.pending: list[bytes] = []
+        self._form_bytes = 0
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._name = ""
+        self._is_file = False
+        self._data = bytearray()
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._data = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise HTTPException(status_code=400, detail="Multipart part without a name")
+        self._name = options[b"name"].decode("utf-8", "replace")
+        self._is_file = self._name == self.file_field
+        if self._is_file:
+            if self.file_seen:
+                raise HTTPException(status_code=400, detail=f"Duplicate field '{self.file_field}'")
+            self.file_seen = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._is_file:
+            self.pending.append(data[start:end])
+            return
+        self._form_bytes += end - start
+        if self._form_bytes > MAX_FORM_OVERHEAD:
+            raise HTTPException(status_code=413, detail="Form fields are too large")
+        self._data += data[start:end]
+
+    def on_part_end(self):
+        if not self._is_file:
+            self.fields[self._name] = self._data.decode("utf-8", "replace")
+
+
+async def spool_multipart(request: Request, path: Path, file_field: str) -> tuple[dict, int, str]:
+    """Разбирает multipart/form-data прямо из потока запроса: поле file_field
+    пишется в spool чанками (с лимитом размера), тело целиком не буферизуется
+    ни в памяти, ни во временном файле. Возвращает (поля, размер, sha256)."""
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    if b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+    form = _MultipartSpool(file_field)
+    parser = MultipartParser(params[b"boundary"], form.callbacks())
+    try:
+        async with SpoolWriter(path, MAX_UPLOAD_BYTES) as writer:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                for data in form.pending:
+                    await writer.write(data)
+                form.pending.clear()
+            parser.finalize()
+    except UploadTooLarge as e:
+        path.unlink(missing_ok=True)
+        raise HTTPException(status_code=413, detail=str(e))
+    except MultipartParseError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
+    if not form.file_seen:
+        raise HTTPException(status_code=422, detail=f"Field '{file_field}' is required")
+    return form.fields, writer.size, writer.sha256
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def file_sha256(path: str) -> str:
+    """sha256 файла, прочитанного чанками (для задач, поставленных без хэша)."""
+    return await asyncio.to_thread(_file_sha256, path)
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Optional
+from app.config import STT_CHUNK_SECONDS, STT_CHUNK_OVERLAP
+from app.services.ffmpeg import probe_duration, run_ffmpeg
+from app.services.limits import memory_budget, compress_limit, transcribe_limit
+from app.services.openrouter import transcribe_audio
+from app.services.silence import SpeechSegment, detect_speech
+
+logger = logging.getLogger(__name__)
+
+# Пауза, на которой можно резать запись (сек): короче, чем для вырезания тишины
+CUT_MIN_SILENCE = 0.5
+# Последняя часть может быть длиннее целевой, чтобы не оставлять короткий хвост
+CHUNK_SLACK = 1.25
+# Сколько реплик на стыке частей сравнивается при склейке
+STITCH_WINDOW = 8
+STITCH_MIN_RATIO = 0.6
+
+_SPEAKER = re.compile(r"^\W*Говорящий\s*(\d+)\W*?:\s*(.*)$", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class Utterance:
+    speaker: Optional[int]
+    text: str
+
+    def render(self) -> str:
+        return f"Говорящий {self.speaker}: {self.text}" if self.speaker else self.text
+
+
+# --- Нарезка ---
+
+def plan_chunks(
+    speech: list[SpeechSegment],
+    duration: float,
+    target: float = STT_CHUNK_SECONDS,
+    overlap: float = STT_CHUNK_OVERLAP,
+) -> list[tuple[float, float]]:
+    """Делит запись на части ~target сек по паузам между репликами.
+
+    Каждая часть, кроме первой, начинается на overlap сек раньше разреза,
+    чтобы при склейке сопоставить говорящих. Если подходящей паузы нет,
+    режет ровно по target.
+    """
+    gaps = [(a.end + b.start) / 2 for a, b in zip(speech, speech[1:])]
+    cuts, start = [], 0.0
+    while duration - start > target * CHUNK_SLACK:
+        wanted = start + target
+        candidates = [g for g in gaps if start + target / 2 < g <= start + target * CHUNK_SLACK]
+        cut = min(candidates, key=lambda g: abs(g - wanted)) if candidates else wanted
+        cuts.append(cut)
+        start = cut
+    bounds = [0.0, *cuts, duration]
+    return [
+        (max(bounds[i] - overlap, 0.0) if i else 0.0, bounds[i + 1])
+        for i in range(len(bounds) - 1)
+    ]
+
+
+async def extract_chunk(source_path: str, output_path: str, start: float, end: float):
+    """Вырезает часть сжатого аудио без перекодирования."""
+    await run_ffmpeg([
+        "-y", "-ss", f"{start:.3f}", "-t", f"{end - start:.3f}",
+        "-i", source_path,
+        "-map", "0:a", "-c", "copy",
+        "-f", "ogg", output_path,
+    ])
+
+
+# --- Транскрибация ---
+
+async def _transcribe_file(path: str) -> str:
+    """Один запрос STT: файл в памяти только в пределах общего бюджета."""
+    size = os.path.getsize(path)
+    # Сначала место в очереди STT: ожидающие его части не держат бюджет
+    async with transcribe_limit, memory_budget.reserve(size):
+        audio_bytes = await asyncio.to_thread(Path(path).read_bytes)
+        return await transcribe_audio(audio_bytes)
+
+
+async def transcribe_recording(recording_id: str, compressed_path: str) -> str:
+    """Транскрибирует сжатую запись; длинную — по частям параллельно.
+
+    Части транскрибируются одновременно (в пределах transcribe_limit),
+    каждая своим запросом со своими повторами, и склеиваются с единой
+    нумерацией говорящих.
+    """
+    duration = await probe_duration(compressed_path)
+    if duration <= STT_CHUNK_SECONDS * CHUNK_SLACK:
+        return await _transcribe_file(compressed_path)
+
+    async with compress_limit:
+        speech, _ = await detect_speech(compressed_path, min_silence=CUT_MIN_SILENCE)
+    chunks = plan_chunks(speech, duration)
+    logger.info(f"Recording {recording_id}: {duration:.0f}s split into {len(chunks)} chunks")
+
+    paths = [f"{compressed_path}.{i}.ogg" for i in range(len(chunks))]
+    tasks = []
+    try:
+        async with compress_limit:
+            for (start, end), path in zip(chunks, paths):
+                await extract_chunk(compressed_path, path, start, end)
+        tasks = [
+            asyncio.create_task(_transcribe_file(path)) for path in paths
+        ]
+        texts = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for path in paths:
+            Path(path).unlink(missing_ok=True)
+    return stitch_transcripts(texts)
+
+
+# --- Склейка ---
+
+def parse_utterances(text: str) -> list[Utterance]:
+    """Разбивает транскрипцию на реплики «Говорящий N: ...»."""
+    utterances: list[Utterance] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if m := _SPEAKER.match(line):
+            utterances.append(Utterance(int(m.group(1)), m.group(2).strip()))
+        elif utterances and utterances[-1].speaker is not None:
+            # Продолжение реплики на новой строке
+            utterances[-1].text += " " + line
+        else:
+            utterances.append(Utterance(None, line))
+    return utterances
+
+
+def _words(text: str) -> str:
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def _match_overlap(tail: list[Utterance], head: list[Utterance]) -> list[tuple[int, int]]:
+    """Пары (индекс в tail, индекс в head) совпадающих реплик на стыке, по порядку."""
+    pairs, after = [], -1
+    for h, utt in enumerate(head):
+        best, best_ratio = None, STITCH_MIN_RATIO
+        for t in range(after + 1, len(tail)):
+            ratio = SequenceMatcher(None, _words(tail[t].text), _words(utt.text)).ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = t, ratio
+        if best is not None:
+            pairs.append((best, h))
+            after = best
+    return pairs
+
+
+def _speaker_mapping(
+    pairs: list[tuple[int, int]], tail: list[Utterance], chunk: list[Utterance], next_speaker: int
+) -> dict[int, int]:
+    """Переводит номера говорящих части в общую нумерацию по совпавшим репликам.
+
+    Номер, не встретившийся на стыке, — новый говорящий: он получает
+    следующий общий номер (next_speaker, next_speaker + 1, ...), а не свой
+    местный, который мог принадлежать другому говорящему прошлых частей.
+    """
+    votes: dict[tuple[int, int], int] = {}
+    for t, h in pairs:
+        local, known = chunk[h].speaker, tail[t].speaker
+        if local is not None and known is not None:
+            votes[(local, known)] = votes.get((local, known), 0) + 1
+    mapping: dict[int, int] = {}
+    for (local, known), _ in sorted(votes.items(), key=lambda kv: -kv[1]):
+        if local not in mapping and known not in mapping.values():
+            mapping[local] = known
+    for local in sorted({u.speaker for u in chunk if u.speaker is not None}):
+        if local not in mapping:
+            mapping[local] = next_speaker
+            next_speaker += 1
+    return mapping
+
+
+def stitch_transcripts(texts: list[str]) -> str:
+    """Склеивает транскрипции перекрывающихся частей.
+
+    Реплики из перекрытия, уже попавшие в предыдущую часть, отбрасываются,
+    а номера говорящих сопоставляются по этим же репликам.
+    """
+    result: list[Utterance] = []
+    speakers = 0  # наибольший выданный общий номер говорящего
+    for text in texts:
+        chunk = parse_utterances(text)
+        tail_start = max(len(result) - STITCH_WINDOW, 0)
+        tail, head = result[tail_start:], chunk[:STITCH_WINDOW]
+        pairs = _match_overlap(tail, head)
+        mapping = _speaker_mapping(pairs, tail, chunk, speakers + 1)
+        speakers = max([speakers, *mapping.values()])
+        skip = pairs[-1][1] + 1 if pairs else 0
+        for utt in chunk[skip:]:
+            speaker = mapping.get(utt.speaker) if utt.speaker is not None else None
+            result.append(Utterance(speaker, utt.text))
+    return "\n".join(u.render() for u in result)
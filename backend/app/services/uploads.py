@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Optional
+from app.config import SPOOL_DIR, UPLOAD_SESSION_TTL
+
+logger = logging.getLogger(__name__)
+
+SESSION_COLUMNS = (
+    "id", "idempotency_key", "metadata", "size", "received",
+    "status", "recording", "created_at", "updated_at",
+)
+
+
+class UploadDataLost(Exception):
+    pass
+
+
+class UploadSessions:
+    """Сессии возобновляемой загрузки (SQLite рядом с очередью в spool).
+
+    Сессия хранит метаданные записи и сколько байт уже принято; файл
+    дописывается в <spool>/audio/<id>.part. Ключ идемпотентности уникален:
+    повторное создание возвращает ту же сессию, а завершённая сессия — уже
+    созданную запись. Брошенные .part удаляет JobQueue.purge_finished.
+    """
+
+    def __init__(self, spool_dir: str, ttl: float):
+        self.spool_dir = Path(spool_dir)
+        self.audio_dir = self.spool_dir / "audio"
+        self.db_path = self.spool_dir / "uploads.sqlite3"
+        self.ttl = ttl
+        # Запись чанков и finalize одной сессии — строго по очереди.
+        # Блокировка живёт, пока ею кто-то пользуется: (lock, число пользователей)
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        self.audio_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_sessions (
+                    id TEXT PRIMARY KEY,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    metadata TEXT NOT NULL,
+                    size INTEGER,
+                    received INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'open',
+                    recording TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    async def open(self):
+        await asyncio.to_thread(self._init_db)
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        session = dict(row)
+        session["metadata"] = json.loads(session["metadata"])
+        session["recording"] = json.loads(session["recording"]) if session["recording"] else None
+        return session
+
+    def path(self, session_id: str) -> Path:
+        return self.audio_dir / f"{session_id}.part"
+
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        """Блокировка сессии. Удаляется, когда её не держит и не ждёт никто,
+        поэтому брошенные и истёкшие сессии блокировок не копят."""
+        lock, users = self._locks.get(session_id, (asyncio.Lock(), 0))
+        self._locks[session_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[session_id]
+            if users == 1:
+                del self._locks[session_id]
+            else:
+                self._locks[session_id] = (lock, users - 1)
+
+    def _create(self, idempotency_key: str, metadata: dict, size: Optional[int]) -> tuple[dict, bool]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM upload_sessions WHERE updated_at < ?", (now - self.ttl,))
+            row = conn.execute(
+                f"SELECT {', '.join(SESSION_COLUMNS)} FROM upload_sessions WHERE idempotency_key = ?",
+                (idempotency_key,),
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return self._row(row), False
+            session_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO upload_sessions (id, idempotency_key, metadata, size, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, idempotency_key, json.dumps(metadata), size, now, now),
+            )
+            row = conn.execute(
+                f"SELECT {', '.join(SESSION_COLUMNS)} FROM upload_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            conn.execute("COMMIT")
+        return self._row(row), True
+
+    async def create(self, idempotency_key: str, metadata: dict, size: Optional[int]) -> tuple[dict, bool]:
+        """Создаёт сессию или возвращает существующую с тем же ключом. (сессия, создана ли)."""
+        return await asyncio.to_thread(self._create, idempotency_key, metadata, size)
+
+    def _get(self, session_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(SESSION_COLUMNS)} FROM upload_sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return self._row(row)
+
+    async def get(self, session_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._get, session_id)
+
+    def _update(self, session_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE upload_sessions SET {assignments} WHERE id = ?", (*fields.values(), session_id)
+            )
+
+    async def set_received(self, session_id: str, received: int):
+        await asyncio.to_thread(self._update, session_id, received=received)
+
+    async def complete(self, session_id: str, recording: dict):
+        """Сессия завершена: повторный finalize вернёт эту запись."""
+        await asyncio.to_thread(
+            self._update, session_id, status="done", recording=json.dumps(recording, default=str)
+        )
+
+    def _truncate(self, session_id: str, size: int):
+        """Отрезает хвост недописанного чанка: в файле остаётся только подтверждённое.
+
+        Файл создаётся только для пустой сессии; если принятые данные
+        пропали (файл удалён или уже перенесён в очередь) — UploadDataLost.
+        """
+        path = self.path(session_id)
+        if not path.exists():
+            if size:
+                raise UploadDataLost(f"Upload {session_id}: data file is missing")
+            path.touch()
+            return
+        with open(path, "r+b") as f:
+            f.truncate(min(size, path.stat().st_size))
+
+    async def truncate(self, session_id: str, size: int):
+        await asyncio.to_thread(self._truncate, session_id, size)
+
+
+upload_sessions = UploadSessions(SPOOL_DIR, UPLOAD_SESSION_TTL)
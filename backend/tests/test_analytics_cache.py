@@ -0,0 +1,59 @@
+import asyncio
+from app.services.analytics_cache import AnalyticsCache
+
+KEY = ("astana", "2026-01-01", "2026-01-31")
+
+
+def test_concurrent_callers_share_one_compute():
+    cache = AnalyticsCache(max_entries=10, ttl=60)
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"calls": calls}
+
+    async def run():
+        results = await asyncio.gather(*(cache.get_or_compute(KEY, compute) for _ in range(5)))
+        cached = await cache.get_or_compute(KEY, compute)
+        return results, cached
+
+    results, cached = asyncio.run(run())
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert cached is results[0]
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 4, 1)
+
+
+def test_result_is_not_stored_after_invalidation_during_compute():
+    cache = AnalyticsCache(max_entries=10, ttl=60)
+    calls = 0
+
+    async def run():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await release.wait()
+            return "stale"
+
+        pending = asyncio.create_task(cache.get_or_compute(KEY, slow))
+        await started.wait()
+        cache.invalidate_city("astana")
+        release.set()
+        stale = await pending
+
+        async def fresh():
+            nonlocal calls
+            calls += 1
+            return "fresh"
+
+        return stale, await cache.get_or_compute(KEY, fresh)
+
+    stale, fresh = asyncio.run(run())
+    assert stale == "stale"
+    assert fresh == "fresh"
+    assert calls == 2
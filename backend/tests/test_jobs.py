@@ -0,0 +1,95 @@
+import asyncio
+import time
+from app.services.jobs import JobQueue, WorkerPool
+
+
+def _queue(tmp_path) -> JobQueue:
+    queue = JobQueue(str(tmp_path))
+    queue._init_db()
+    return queue
+
+
+def _upload(queue: JobQueue, data: bytes = b"audio"):
+    path = queue.new_upload_path()
+    path.write_bytes(data)
+    return path
+
+
+def _job(queue: JobQueue, job_id: str) -> dict:
+    with queue._connect() as conn:
+        return dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def test_claim_takes_oldest_queued_job(tmp_path):
+    queue = _queue(tmp_path)
+    ids = [queue._enqueue(f"rec-{i}", "teacher", "astana", _upload(queue), None) for i in range(3)]
+    for i, job_id in enumerate(ids):
+        queue._update(job_id, created_at=1000 - i)
+
+    claimed = [queue._claim("w")["id"] for _ in range(3)]
+    assert claimed == list(reversed(ids))
+    assert queue._claim("w") is None
+    job = _job(queue, ids[0])
+    assert (job["status"], job["worker_id"], job["attempts"]) == ("running", "w", 1)
+
+
+def test_recover_stale_requeues_or_exhausts(tmp_path):
+    queue = _queue(tmp_path)
+    retry_id = queue._enqueue("rec-retry", "teacher", "astana", _upload(queue), None)
+    exhausted_id = queue._enqueue("rec-dead", "mop", "astana", _upload(queue), None)
+    fresh_id = queue._enqueue("rec-fresh", "mop", "astana", _upload(queue), None)
+    for _ in range(3):
+        queue._claim("w")
+    old = time.time() - 1000
+    queue._update(retry_id, heartbeat_at=old, attempts=1)
+    queue._update(exhausted_id, heartbeat_at=old, attempts=3)
+
+    requeued, exhausted = queue._recover_stale(stale_after=60, max_attempts=3)
+
+    assert requeued == ["rec-retry"]
+    assert [job["recording_id"] for job in exhausted] == ["rec-dead"]
+    assert _job(queue, retry_id)["status"] == "queued"
+    assert _job(queue, retry_id)["worker_id"] is None
+    assert _job(queue, exhausted_id)["status"] == "failed"
+    assert _job(queue, fresh_id)["status"] == "running"
+
+
+def test_retry_needs_audio_on_disk(tmp_path):
+    queue = _queue(tmp_path)
+    kept_id = queue._enqueue("rec-kept", "teacher", "astana", _upload(queue), None)
+    lost_id = queue._enqueue("rec-lost", "teacher", "astana", _upload(queue), None)
+    for job_id in (kept_id, lost_id):
+        queue._update(job_id, status="failed", attempts=2, error="boom")
+    (queue.audio_dir / lost_id).unlink()
+
+    assert queue._retry("rec-lost") is False
+    assert _job(queue, lost_id)["status"] == "failed"
+
+    assert queue._retry("rec-kept") is True
+    job = _job(queue, kept_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("queued", 0, None)
+
+
+def test_stop_requeues_cancelled_job(tmp_path):
+    queue = _queue(tmp_path)
+    job_id = queue._enqueue("rec", "teacher", "astana", _upload(queue), None)
+
+    async def run():
+        started = asyncio.Event()
+
+        async def handler(job):
+            started.set()
+            await asyncio.Event().wait()
+
+        async def on_exhausted(job):
+            pass
+
+        pool = WorkerPool(queue, handler, 1, on_exhausted)
+        pool.start()
+        await asyncio.wait_for(started.wait(), 5)
+        await pool.stop(drain_timeout=0.1)
+
+    asyncio.run(run())
+    job = _job(queue, job_id)
+    assert (job["status"], job["worker_id"]) == ("queued", None)
+    assert (queue.audio_dir / job_id).exists()
@@ -0,0 +1,37 @@
+import pytest
+from app.database import projection
+
+
+def test_plain_columns():
+    assert projection("id", "status", "score") == "id, status, score"
+
+
+@pytest.mark.parametrize("column", ["*", "transcription", "analysis", "text:analysis"])
+def test_heavy_columns_require_flag(column):
+    with pytest.raises(ValueError):
+        projection("id", column)
+
+
+def test_heavy_flag_allows_heavy_columns():
+    assert projection("id", "transcription", heavy=True) == "id, transcription"
+    assert projection("*", heavy=True) == "*"
+
+
+def test_embedded_light_columns():
+    select = projection("id", "recordings(score, status, employees!inner(name, role))")
+    assert select == "id, recordings(score, status, employees!inner(name, role))"
+
+
+@pytest.mark.parametrize("embedded", [
+    "recordings(*)",
+    "recordings(*, transcription)",
+    "recordings(score, analysis)",
+    "clients!inner(name, recordings(id, transcription))",
+])
+def test_embedded_heavy_columns_require_flag(embedded):
+    with pytest.raises(ValueError):
+        projection("id", embedded)
+
+
+def test_heavy_flag_allows_embedded_heavy_columns():
+    assert projection("recordings(*, transcription)", heavy=True) == "recordings(*, transcription)"
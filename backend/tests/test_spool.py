@@ -0,0 +1,66 @@
+import asyncio
+import hashlib
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from app.services import spool
+from app.services.spool import spool_multipart
+
+BOUNDARY = "testboundary"
+
+
+def _body(fields: dict, audio: bytes | None) -> bytes:
+    parts = [
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    if audio is not None:
+        parts.append(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="audio"; filename="a.ogg"\r\n'
+            f'Content-Type: audio/ogg\r\n\r\n'.encode() + audio + b"\r\n"
+        )
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+def _request(body: bytes, chunk: int = 7) -> Request:
+    messages = [
+        {"type": "http.request", "body": body[i:i + chunk], "more_body": i + chunk < len(body)}
+        for i in range(0, len(body), chunk)
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())],
+    }
+    return Request(scope, receive)
+
+
+def test_fields_and_file_are_split(tmp_path):
+    audio = b"\x00\x01audio\r\n--data" * 100
+    path = tmp_path / "upload"
+    fields, size, digest = asyncio.run(spool_multipart(
+        _request(_body({"client_name": "Иван", "city": "astana"}, audio)), path, "audio",
+    ))
+    assert fields == {"client_name": "Иван", "city": "astana"}
+    assert size == len(audio)
+    assert digest == hashlib.sha256(audio).hexdigest()
+    assert path.read_bytes() == audio
+
+
+def test_missing_file_field(tmp_path):
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(spool_multipart(_request(_body({"city": "astana"}, None)), tmp_path / "upload", "audio"))
+    assert e.value.status_code == 422
+
+
+def test_file_over_limit_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "MAX_UPLOAD_BYTES", 10)
+    path = tmp_path / "upload"
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(spool_multipart(_request(_body({}, b"x" * 11)), path, "audio"))
+    assert e.value.status_code == 413
+    assert not path.exists()
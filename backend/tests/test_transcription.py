@@ -0,0 +1,60 @@
+from app.services.transcription import parse_utterances, stitch_transcripts
+
+
+def test_overlap_is_dropped_and_speakers_matched():
+    first = (
+        "Говорящий 1: Здравствуйте, меня зовут Анна, я преподаватель вокала.\n"
+        "Говорящий 2: Добрый день, я хотела бы научиться петь.\n"
+        "Говорящий 1: Отлично, давайте начнём с распевки."
+    )
+    # Во второй части те же люди пронумерованы наоборот
+    second = (
+        "Говорящий 1: Добрый день, я хотела бы научиться петь.\n"
+        "Говорящий 2: Отлично, давайте начнём с распевки.\n"
+        "Говорящий 1: Хорошо, я готова.\n"
+        "Говорящий 2: Повторяйте за мной."
+    )
+    assert stitch_transcripts([first, second]).splitlines() == [
+        "Говорящий 1: Здравствуйте, меня зовут Анна, я преподаватель вокала.",
+        "Говорящий 2: Добрый день, я хотела бы научиться петь.",
+        "Говорящий 1: Отлично, давайте начнём с распевки.",
+        "Говорящий 2: Хорошо, я готова.",
+        "Говорящий 1: Повторяйте за мной.",
+    ]
+
+
+def test_unmatched_speaker_gets_fresh_number():
+    first = (
+        "Говорящий 1: Сегодня разберём аккорды на гитаре.\n"
+        "Говорящий 2: Я уже знаю несколько аккордов."
+    )
+    # Говорящий 2 второй части не встречался на стыке — это новый человек
+    second = (
+        "Говорящий 1: Я уже знаю несколько аккордов.\n"
+        "Говорящий 2: Извините, можно я заберу ребёнка пораньше?"
+    )
+    lines = stitch_transcripts([first, second]).splitlines()
+    assert lines == [
+        "Говорящий 1: Сегодня разберём аккорды на гитаре.",
+        "Говорящий 2: Я уже знаю несколько аккордов.",
+        "Говорящий 3: Извините, можно я заберу ребёнка пораньше?",
+    ]
+
+
+def test_chunks_without_overlap_do_not_reuse_numbers():
+    lines = stitch_transcripts([
+        "Говорящий 1: Первая часть урока.",
+        "Говорящий 1: Совсем другой разговор после перерыва.",
+    ]).splitlines()
+    assert lines == [
+        "Говорящий 1: Первая часть урока.",
+        "Говорящий 2: Совсем другой разговор после перерыва.",
+    ]
+
+
+def test_parse_utterances_joins_continuation_lines():
+    utterances = parse_utterances("Говорящий 1: Начало фразы\nи её продолжение\nГоворящий 2: Ответ")
+    assert [(u.speaker, u.text) for u in utterances] == [
+        (1, "Начало фразы и её продолжение"),
+        (2, "Ответ"),
+    ]
@@ -0,0 +1,146 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
+from app.routers import recordings
+from app.services.uploads import UploadSessions
+
+METADATA = {
+    "employee_telegram_id": 42,
+    "client_name": "Иван",
+    "lesson_datetime": "01.02.2026 10:00",
+    "city": "astana",
+}
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    sessions = UploadSessions(str(tmp_path), ttl=3600)
+    asyncio.run(sessions.open())
+    monkeypatch.setattr(recordings, "upload_sessions", sessions)
+
+    async def admit(size=None):
+        pass
+
+    monkeypatch.setattr(recordings, "_check_admission", admit)
+    return sessions
+
+
+@pytest.fixture
+def ingested(monkeypatch):
+    """Вместо ingest_recording и очереди: запоминает файл и «переносит» его."""
+    calls = []
+
+    async def ingest(upload_path, audio_hash, *args):
+        calls.append(upload_path.read_bytes())
+        upload_path.unlink()
+        return {
+            "id": f"rec-{len(calls)}", "client_id": "c", "employee_id": "e",
+            "status": "pending", "created_at": "2026-02-01T10:00:00+05:00",
+        }
+
+    monkeypatch.setattr(recordings, "_ingest", ingest)
+    return calls
+
+
+@pytest.fixture
+def app(sessions, ingested):
+    app = FastAPI()
+    app.include_router(recordings.router)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return TestClient(app)
+
+
+def _create(client, key="key-1", size=None):
+    resp = client.post("/api/recordings/uploads", json={**METADATA, "idempotency_key": key, "size": size})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_session_creation_is_idempotent(client):
+    first = _create(client, size=5)
+    client.put(f"/api/recordings/uploads/{first['id']}", params={"offset": 0}, content=b"he")
+    again = _create(client, size=5)
+    assert again["id"] == first["id"]
+    assert again["offset"] == 2
+    assert _create(client, key="key-2")["id"] != first["id"]
+
+
+def test_offset_mismatch(client):
+    upload = _create(client)
+    client.put(f"/api/recordings/uploads/{upload['id']}", params={"offset": 0}, content=b"abc")
+    resp = client.put(f"/api/recordings/uploads/{upload['id']}", params={"offset": 1}, content=b"x")
+    assert resp.status_code == 409
+    assert resp.headers["Upload-Offset"] == "3"
+
+
+def test_unknown_session_is_404_without_lock(client, sessions):
+    resp = client.put("/api/recordings/uploads/missing", params={"offset": 0}, content=b"x")
+    assert resp.status_code == 404
+    assert client.post("/api/recordings/uploads/missing/finalize").status_code == 404
+    assert sessions._locks == {}
+
+
+def test_disconnect_keeps_received_part_and_resume_truncates_tail(app, client, sessions):
+    upload = _create(client, size=6)
+    messages = [
+        {"type": "http.request", "body": b"abc", "more_body": True},
+        {"type": "http.disconnect"},
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        pass
+
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "PUT", "scheme": "http",
+        "path": f"/api/recordings/uploads/{upload['id']}", "raw_path": b"",
+        "query_string": b"offset=0", "headers": [], "client": ("test", 1), "server": ("test", 80),
+    }
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(app(scope, receive, send))
+
+    assert client.get(f"/api/recordings/uploads/{upload['id']}").json()["offset"] == 3
+    # Хвост, записанный после последнего подтверждения, отрезается при продолжении
+    with open(sessions.path(upload["id"]), "ab") as f:
+        f.write(b"garbage")
+    resp = client.put(f"/api/recordings/uploads/{upload['id']}", params={"offset": 3}, content=b"def")
+    assert resp.json()["offset"] == 6
+    assert sessions.path(upload["id"]).read_bytes() == b"abcdef"
+
+
+def test_body_larger_than_declared_size(client, sessions):
+    upload = _create(client, size=4)
+    client.put(f"/api/recordings/uploads/{upload['id']}", params={"offset": 0}, content=b"ab")
+    resp = client.put(f"/api/recordings/uploads/{upload['id']}", params={"offset": 2}, content=b"cdef")
+    assert resp.status_code == 400
+    assert client.get(f"/api/recordings/uploads/{upload['id']}").json()["offset"] == 2
+    assert sessions.path(upload["id"]).read_bytes() == b"ab"
+
+
+def test_incomplete_upload_cannot_be_finalized(client):
+    upload = _create(client, size=4)
+    client.put(f"/api/recordings/uploads/{upload['id']}", params={"offset": 0}, content=b"ab")
+    resp = client.post(f"/api/recordings/uploads/{upload['id']}/finalize")
+    assert resp.status_code == 409
+    assert resp.headers["Upload-Offset"] == "2"
+
+
+def test_double_finalize_returns_same_recording(client, ingested):
+    upload = _create(client, size=5)
+    client.put(f"/api/recordings/uploads/{upload['id']}", params={"offset": 0}, content=b"hello")
+    first = client.post(f"/api/recordings/uploads/{upload['id']}/finalize")
+    second = client.post(f"/api/recordings/uploads/{upload['id']}/finalize")
+    assert first.status_code == second.status_code == 200
+    assert first.json()["status"] == "done"
+    assert second.json()["recording"]["id"] == first.json()["recording"]["id"]
+    assert ingested == [b"hello"]
+    resp = client.put(f"/api/recordings/uploads/{upload['id']}", params={"offset": 5}, content=b"x")
+    assert resp.status_code == 409
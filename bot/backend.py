@@ -0,0 +1,29 @@
+import httpx
+from config import BACKEND_URL
+
+
+class Backend:
+    """Общий HTTP-клиент backend: один пул соединений на весь процесс бота.
+
+    Открывается при старте (main) и закрывается при остановке. Загрузки
+    файлов идут своим клиентом с потоковыми таймаутами (relay).
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._http: httpx.AsyncClient | None = None
+
+    def open(self):
+        self._http = httpx.AsyncClient(base_url=self.base_url, timeout=10)
+
+    async def close(self):
+        if self._http:
+            await self._http.aclose()
+            self._http = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self._http
+
+
+backend = Backend(BACKEND_URL)
@@ -7,3 +7,15 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 TELEGRAM_API_ID = int(os.getenv("TELEGRAM_API_ID", "0"))
 TELEGRAM_API_HASH = os.getenv("TELEGRAM_API_HASH", "")
+
+# Приём уведомлений от backend о завершении обработки (BOT_WEBHOOK_URL в backend)
+NOTIFY_HOST = os.getenv("NOTIFY_HOST", "127.0.0.1")
+NOTIFY_PORT = int(os.getenv("NOTIFY_PORT", "8081"))
+NOTIFY_SECRET = os.getenv("NOTIFY_SECRET", "")
+
+# Индекс уже загруженных файлов (file_unique_id → запись), SQLite
+FILE_INDEX_PATH = os.getenv("FILE_INDEX_PATH", "file_index.sqlite3")
+
+# Кэш профилей сотрудников: число профилей и время жизни (сек)
+EMPLOYEE_CACHE_SIZE = int(os.getenv("EMPLOYEE_CACHE_SIZE", "1000"))
+EMPLOYEE_CACHE_TTL = float(os.getenv("EMPLOYEE_CACHE_TTL", "300"))
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+import httpx
+from backend import backend
+from config import EMPLOYEE_CACHE_SIZE, EMPLOYEE_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# «Не зарегистрирован» помним недолго: после /start профиль появится сразу
+NEGATIVE_TTL = 30
+# Сколько сотрудников запрашивать у backend одним batch-запросом
+BATCH_SIZE = 200
+
+
+class EmployeeCache:
+    """LRU/TTL-кэш профилей сотрудников (GET /api/employees/{telegram_id}).
+
+    Профиль нужен на каждое сообщение и каждую загрузку, а меняется редко:
+    обработчики берут его из памяти. Параллельные запросы одного профиля
+    ждут один поход в backend. Регистрация кладёт новый профиль сразу.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[float, dict | None]] = OrderedDict()
+        self._inflight: dict[int, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, telegram_id: int, refresh: bool = False) -> dict | None:
+        """Профиль сотрудника или None, если он не зарегистрирован."""
+        entry = self._entries.get(telegram_id)
+        if entry and entry[0] > time.monotonic() and not refresh:
+            self._entries.move_to_end(telegram_id)
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(telegram_id)
+        if not task:
+            self.misses += 1
+            task = asyncio.create_task(self._fetch(telegram_id))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[telegram_id] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(self, telegram_id: int) -> dict | None:
+        try:
+            resp = await backend.http.get(f"/api/employees/{telegram_id}")
+            if resp.status_code == 404:
+                self._store(telegram_id, None)
+                return None
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            # Сбой backend не кэшируется: следующий запрос спросит снова
+            logger.warning(f"Employee {telegram_id} lookup failed: {e!r}")
+            return None
+        finally:
+            self._inflight.pop(telegram_id, None)
+        employee = resp.json()
+        self._store(telegram_id, employee)
+        return employee
+
+    async def warm(self, telegram_ids: list[int]):
+        """Загружает профили пачками через batch-эндпоинт (при старте бота)."""
+        for i in range(0, len(telegram_ids), BATCH_SIZE):
+            batch = telegram_ids[i:i + BATCH_SIZE]
+            resp = await backend.http.get("/api/employees", params={"telegram_id": batch})
+            resp.raise_for_status()
+            for employee in resp.json():
+                self._store(employee["telegram_id"], employee)
+        logger.info(f"Employee cache warmed: {len(self._entries)} profiles")
+
+    def put(self, employee: dict):
+        self._store(employee["telegram_id"], employee)
+
+    def invalidate(self, telegram_id: int):
+        self._entries.pop(telegram_id, None)
+
+    def _store(self, telegram_id: int, employee: dict | None):
+        ttl = self.ttl if employee else NEGATIVE_TTL
+        self._entries[telegram_id] = (time.monotonic() + ttl, employee)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+employee_cache = EmployeeCache(EMPLOYEE_CACHE_SIZE, EMPLOYEE_CACHE_TTL)
@@ -0,0 +1,96 @@
+import asyncio
+import sqlite3
+import time
+from contextlib import contextmanager
+from config import FILE_INDEX_PATH
+
+
+class FileIndex:
+    """Какие файлы Telegram уже загружены: (file_unique_id, сотрудник) → запись backend.
+
+    file_unique_id одинаков у пересланных и повторно отправленных копий
+    файла, поэтому известный файл не скачивается и не отправляется второй
+    раз. Один и тот же файл от разных сотрудников (преподаватель и МОП
+    одного урока) — разные записи.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    file_unique_id TEXT NOT NULL,
+                    telegram_id INTEGER NOT NULL,
+                    recording_id TEXT NOT NULL,
+                    client_name TEXT NOT NULL,
+                    lesson_datetime TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (file_unique_id, telegram_id)
+                )
+            """)
+
+    async def open(self):
+        await asyncio.to_thread(self._init_db)
+
+    def _get(self, file_unique_id: str, telegram_id: int) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT recording_id, client_name, lesson_datetime FROM files"
+                " WHERE file_unique_id = ? AND telegram_id = ?",
+                (file_unique_id, telegram_id),
+            ).fetchone()
+        return dict(row) if row else None
+
+    async def get(self, file_unique_id: str, telegram_id: int) -> dict | None:
+        return await asyncio.to_thread(self._get, file_unique_id, telegram_id)
+
+    def _put(self, file_unique_id: str, telegram_id: int, recording_id: str, client_name: str, lesson_datetime: str):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files"
+                " (file_unique_id, telegram_id, recording_id, client_name, lesson_datetime, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (file_unique_id, telegram_id, recording_id, client_name, lesson_datetime, time.time()),
+            )
+
+    async def put(self, file_unique_id: str, telegram_id: int, recording_id: str, client_name: str, lesson_datetime: str):
+        await asyncio.to_thread(self._put, file_unique_id, telegram_id, recording_id, client_name, lesson_datetime)
+
+    def _telegram_ids(self, limit: int) -> list[int]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT telegram_id FROM files GROUP BY telegram_id"
+                " ORDER BY max(created_at) DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [row["telegram_id"] for row in rows]
+
+    async def telegram_ids(self, limit: int) -> list[int]:
+        """Сотрудники, недавно загружавшие записи (для прогрева кэша профилей)."""
+        return await asyncio.to_thread(self._telegram_ids, limit)
+
+    def _delete(self, file_unique_id: str, telegram_id: int):
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM files WHERE file_unique_id = ? AND telegram_id = ?",
+                (file_unique_id, telegram_id),
+            )
+
+    async def delete(self, file_unique_id: str, telegram_id: int):
+        """Запись удалили в backend — файл можно загрузить заново."""
+        await asyncio.to_thread(self._delete, file_unique_id, telegram_id)
+
+
+file_index = FileIndex(FILE_INDEX_PATH)
@@ -1,7 +1,6 @@
-import httpx
 from aiogram import Router, F
 from aiogram.types import Message
-from config import BACKEND_URL
+from employee_cache import employee_cache
 
 router = Router()
 
@@ -20,13 +19,11 @@ CITY_NAMES = {
 
 @router.message(F.text == "/profile")
 async def cmd_profile(message: Message):
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{BACKEND_URL}/api/employees/{message.from_user.id}")
-    if resp.status_code != 200:
+    emp = await employee_cache.get(message.from_user.id)
+    if not emp:
         await message.answer("Вы не зарегистрированы. Используйте /start")
         return
 
-    emp = resp.json()
     role_text = "Преподаватель" if emp["role"] == "teacher" else "Менеджер отдела продаж"
     city_text = CITY_NAMES.get(emp["city"], emp["city"])
     text = f"Ваш профиль:\n\n{emp['name']}\n{role_text} — {city_text}"
@@ -41,9 +38,7 @@ async def cmd_profile(message: Message):
 @router.message(F.text == "/status")
 async def cmd_status(message: Message):
     # Получаем последние записи через сотрудника
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{BACKEND_URL}/api/employees/{message.from_user.id}")
-    if resp.status_code != 200:
+    if not await employee_cache.get(message.from_user.id):
         await message.answer("Вы не зарегистрированы. Используйте /start")
         return
 
@@ -6,6 +6,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from config import BACKEND_URL
+from employee_cache import employee_cache
 
 router = Router()
 
@@ -34,16 +35,14 @@ class RegisterState(StatesGroup):
 @router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext):
     # Проверяем, зарегистрирован ли уже
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{BACKEND_URL}/api/employees/{message.from_user.id}")
-        if resp.status_code == 200:
-            emp = resp.json()
-            await message.answer(
-                f"Вы уже зарегистрированы как {emp['name']}.\n"
-                f"Используйте /new для отправки записи.\n"
-                f"Используйте /profile для просмотра профиля."
-            )
-            return
+    emp = await employee_cache.get(message.from_user.id)
+    if emp:
+        await message.answer(
+            f"Вы уже зарегистрированы как {emp['name']}.\n"
+            f"Используйте /new для отправки записи.\n"
+            f"Используйте /profile для просмотра профиля."
+        )
+        return
 
     await state.set_state(RegisterState.name)
     await message.answer("Добро пожаловать в Beethoven! Как вас зовут?")
@@ -145,6 +144,8 @@ async def _finish_registration(message, state: FSMContext, telegram_id: int):
         resp = await client.post(f"{BACKEND_URL}/api/employees", json=payload)
 
     if resp.status_code == 200:
+        # Профиль сразу в кэше: следующее сообщение не пойдёт в backend
+        employee_cache.put(resp.json())
         role_text = "Преподаватель" if data["role"] == "teacher" else "Менеджер отдела продаж"
         city_text = "Астана" if data["city"] == "astana" else "Усть-Каменогорск"
         text = f"Регистрация завершена!\n\n{data['name']}\n{role_text} — {city_text}"
@@ -158,6 +159,8 @@ async def _finish_registration(message, state: FSMContext, telegram_id: int):
         text += "\n\nИспользуйте /new для отправки записи."
         await message.edit_text(text)
     else:
+        # 409 — уже зарегистрирован: закэшированное «нет профиля» устарело
+        employee_cache.invalidate(telegram_id)
         await message.edit_text(f"Ошибка регистрации: {resp.text}")
 
     await state.clear()
@@ -8,7 +8,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from pyrogram import Client as PyrogramClient
-from config import BACKEND_URL
+from relay import RelayStats, UploadError, DownloadError, relay_upload
+from file_index import file_index
+from employee_cache import employee_cache
+from backend import backend
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +25,14 @@ RESULT_PARSE = {
     "предоплату": "prepayment",
 }
 
+STATUS_TEXT = {
+    "pending": "в очереди",
+    "transcribing": "транскрибация",
+    "analyzing": "анализ",
+    "done": "готово",
+    "error": "ошибка обработки",
+}
+
 
 class UploadState(StatesGroup):
     audio = State()
@@ -67,6 +78,9 @@ async def handle_audio_message(message: Message, state: FSMContext, bot: Bot, py
         await message.answer("Вы не зарегистрированы. Используйте /start")
         return
 
+    if await _report_duplicate(message, employee):
+        return
+
     caption = message.caption or ""
 
     # Пробуем распарсить подпись
@@ -76,8 +90,7 @@ async def handle_audio_message(message: Message, state: FSMContext, bot: Bot, py
         return
 
     # Если подписи нет или не распознана — переключаемся на пошаговый флоу
-    file_id = _get_file_id(message)
-    await state.update_data(file_id=file_id, employee=employee)
+    await state.update_data(file=_get_file(message), employee=employee)
     await state.set_state(UploadState.date_input)
     await message.answer(
         "Аудио получено! Выберите дату урока или введите вручную (ДД.ММ.ГГГГ):",
@@ -100,8 +113,11 @@ async def cmd_new(message: Message, state: FSMContext):
 
 @router.message(UploadState.audio, F.audio | F.voice | F.document)
 async def process_audio(message: Message, state: FSMContext):
-    file_id = _get_file_id(message)
-    await state.update_data(file_id=file_id)
+    data = await state.get_data()
+    if await _report_duplicate(message, data["employee"]):
+        await state.clear()
+        return
+    await state.update_data(file=_get_file(message))
     await state.set_state(UploadState.date_input)
     await message.answer(
         "Выберите дату урока или введите вручную (ДД.ММ.ГГГГ):",
@@ -183,7 +199,7 @@ async def process_client_name(message: Message, state: FSMContext, bot: Bot, pyr
             "result": None,
         }
         await message.answer("Отправляю запись на обработку...")
-        await _process_upload(message, bot, employee, parsed, data.get("file_id"), pyrogram_client=pyrogram_client)
+        await _process_upload(message, bot, employee, parsed, data.get("file"), pyrogram_client=pyrogram_client)
         await state.clear()
         return
 
@@ -208,20 +224,22 @@ async def process_result(callback: CallbackQuery, state: FSMContext, bot: Bot, p
     }
     await callback.answer()
     await callback.message.edit_text("Отправляю запись на обработку...")
-    await _process_upload(callback.message, bot, data["employee"], parsed, data.get("file_id"), pyrogram_client=pyrogram_client)
+    await _process_upload(callback.message, bot, data["employee"], parsed, data.get("file"), pyrogram_client=pyrogram_client)
     await state.clear()
 
 
 # --- Утилиты ---
 
-def _get_file_id(message: Message) -> str:
-    if message.audio:
-        return message.audio.file_id
-    elif message.voice:
-        return message.voice.file_id
-    elif message.document:
-        return message.document.file_id
-    return ""
+def _get_file(message: Message) -> dict | None:
+    """file_id для скачивания, file_unique_id (один и тот же у пересланных копий) и размер."""
+    media = message.audio or message.voice or message.document
+    if not media:
+        return None
+    return {
+        "file_id": media.file_id,
+        "file_unique_id": media.file_unique_id,
+        "file_size": media.file_size,
+    }
 
 
 def _parse_caption(caption: str, role: str = "sales_manager") -> dict | None:
@@ -255,11 +273,40 @@ def _parse_caption(caption: str, role: str = "sales_manager") -> dict | None:
 
 
 async def _get_employee(telegram_id: int) -> dict | None:
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(f"{BACKEND_URL}/api/employees/{telegram_id}")
-        if resp.status_code == 200:
-            return resp.json()
-    return None
+    return await employee_cache.get(telegram_id)
+
+
+async def _report_duplicate(message: Message, employee: dict) -> bool:
+    """Файл уже загружен этим сотрудником — сообщаем статус той записи
+    вместо повторного скачивания и отправки."""
+    file = _get_file(message)
+    if not file:
+        return False
+    known = await file_index.get(file["file_unique_id"], employee["telegram_id"])
+    if not known:
+        return False
+
+    try:
+        resp = await backend.http.get(f"/api/recordings/{known['recording_id']}/status")
+    except httpx.HTTPError as e:
+        # Backend недоступен — статус не узнать, загружаем как обычно
+        logger.warning(f"Duplicate status check failed: {e!r}")
+        return False
+    if resp.status_code == 404:
+        # Запись (или клиента) удалили — файл снова можно загрузить
+        await file_index.delete(file["file_unique_id"], employee["telegram_id"])
+        return False
+    if resp.status_code != 200:
+        return False
+
+    status = resp.json()["status"]
+    await message.answer(
+        f"Эта запись уже загружена.\n\n"
+        f"Клиент: {known['client_name']}\n"
+        f"Дата: {known['lesson_datetime']}\n"
+        f"Статус: {STATUS_TEXT.get(status, status)}"
+    )
+    return True
 
 
 async def _process_upload(
@@ -267,56 +314,50 @@ async def _process_upload(
     bot: Bot,
     employee: dict,
     parsed: dict,
-    file_id: str | None = None,
+    file: dict | None = None,
     pyrogram_client: PyrogramClient = None,
 ):
-    if not file_id:
-        file_id = _get_file_id(message)
-        if not file_id:
+    if not file:
+        file = _get_file(message)
+        if not file:
             await message.answer("Не удалось получить аудиофайл.")
             return
 
-    # 1. Скачиваем файл через Pyrogram (MTProto, лимит 2GB)
-    try:
-        downloaded = await pyrogram_client.download_media(
-            file_id,
-            in_memory=True,
-        )
-        audio_data = downloaded.getvalue()
-    except Exception as e:
-        logger.error(f"Pyrogram download failed: {e}")
-        await message.answer(f"Ошибка при скачивании файла: {e}")
-        return
-
-    logger.info(f"Downloaded {len(audio_data)} bytes from Telegram")
-
-    # 2. Отправляем аудио + метаданные на backend
+    # Файл не копируется в память целиком: чанки из Telegram (MTProto) сразу
+    # уходят в возобновляемую загрузку backend, обрыв досылается с места обрыва
     form_data = {
-        "employee_telegram_id": str(employee["telegram_id"]),
+        "employee_telegram_id": employee["telegram_id"],
         "client_name": parsed["client_name"],
         "lesson_datetime": parsed["lesson_datetime"],
         "city": employee["city"],
+        "result": parsed.get("result"),
     }
-    if parsed.get("result"):
-        form_data["result"] = parsed["result"]
 
     result_text = RESULT_MAP.get(parsed.get("result", ""), "—")
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-        resp = await client.post(
-            f"{BACKEND_URL}/api/recordings",
-            data=form_data,
-            files={"audio": ("recording.ogg", audio_data, "audio/ogg")},
-        )
+    stats = RelayStats()
+    try:
+        recording = await relay_upload(pyrogram_client, file, form_data, stats)
+    except DownloadError as e:
+        logger.error(f"Pyrogram download failed after {stats.bytes} bytes: {e}")
+        await message.answer(f"Ошибка при скачивании файла: {e}")
+        return
+    except (UploadError, httpx.HTTPError) as e:
+        logger.error(f"Upload to backend failed after {stats.bytes} bytes: {e!r}")
+        await message.answer(f"Ошибка при отправке: {e}")
+        return
 
-    if resp.status_code == 200:
-        result_line = f"Результат: {result_text}\n" if parsed.get("result") else ""
-        await message.answer(
-            f"Запись принята!\n\n"
-            f"Клиент: {parsed['client_name']}\n"
-            f"Дата: {parsed['lesson_datetime']}\n"
-            f"{result_line}\n"
-            f"Обработка займёт несколько минут."
-        )
-    else:
-        await message.answer(f"Ошибка при отправке: {resp.text}")
+    logger.info(f"Relayed {stats.bytes} bytes from Telegram to backend")
+    await file_index.put(
+        file["file_unique_id"], employee["telegram_id"], recording["id"],
+        parsed["client_name"], parsed["lesson_datetime"],
+    )
+
+    result_line = f"Результат: {result_text}\n" if parsed.get("result") else ""
+    await message.answer(
+        f"Запись принята!\n\n"
+        f"Клиент: {parsed['client_name']}\n"
+        f"Дата: {parsed['lesson_datetime']}\n"
+        f"{result_line}\n"
+        f"Обработка займёт несколько минут."
+    )
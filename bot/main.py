@@ -3,8 +3,12 @@ import logging
 from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from pyrogram import Client as PyrogramClient
-from config import TELEGRAM_BOT_TOKEN, TELEGRAM_API_ID, TELEGRAM_API_HASH
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_API_ID, TELEGRAM_API_HASH, EMPLOYEE_CACHE_SIZE
 from handlers import register, upload, profile
+from notifications import SendQueue, start_notification_server
+from file_index import file_index
+from employee_cache import employee_cache
+from backend import backend
 
 logging.basicConfig(level=logging.INFO)
 
@@ -29,13 +33,30 @@ dp.include_router(profile.router)
 async def main():
     await pyrogram_client.start()
     logging.info("Pyrogram client started")
+    await file_index.open()
+
+    backend.open()
+    # Профили недавно загружавших сотрудников — в кэш одним batch-запросом
+    try:
+        await employee_cache.warm(await file_index.telegram_ids(EMPLOYEE_CACHE_SIZE))
+    except Exception:
+        logging.exception("Employee cache warm-up failed")
 
     # Пробрасываем в хендлеры через aiogram DI
     dp["pyrogram_client"] = pyrogram_client
 
+    # Уведомления о готовых анализах: HTTP-эндпоинт для backend + очередь отправки
+    send_queue = SendQueue(bot)
+    send_queue.start()
+    notify_runner = await start_notification_server(send_queue)
+
     try:
         await dp.start_polling(bot)
     finally:
+        if notify_runner:
+            await notify_runner.cleanup()
+        await send_queue.stop()
+        await backend.close()
         await pyrogram_client.stop()
         logging.info("Pyrogram client stopped")
 
@@ -0,0 +1,121 @@
+import asyncio
+import hmac
+import logging
+import time
+from aiohttp import web
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from config import NOTIFY_HOST, NOTIFY_PORT, NOTIFY_SECRET
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду всего и 1 в секунду в один чат
+GLOBAL_INTERVAL = 1 / 25
+CHAT_INTERVAL = 1.0
+QUEUE_SIZE = 1000
+SEND_ATTEMPTS = 3
+
+
+class SendQueue:
+    """Очередь исходящих сообщений с ограничением частоты отправки.
+
+    Сообщения уходят по одному с интервалом не меньше GLOBAL_INTERVAL,
+    в один чат — не чаще раза в CHAT_INTERVAL. На 429 (TelegramRetryAfter)
+    вся очередь ждёт столько, сколько попросил Telegram.
+    """
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue(QUEUE_SIZE)
+        self._last_sent: dict[int, float] = {}
+        self._next_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def put(self, chat_id: int, text: str) -> bool:
+        try:
+            self._queue.put_nowait((chat_id, text))
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"Send queue is full, message to {chat_id} dropped")
+            return False
+
+    async def _wait_turn(self, chat_id: int):
+        now = time.monotonic()
+        ready_at = max(self._next_at, self._last_sent.get(chat_id, 0.0) + CHAT_INTERVAL)
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    async def _run(self):
+        while True:
+            chat_id, text = await self._queue.get()
+            for attempt in range(SEND_ATTEMPTS):
+                await self._wait_turn(chat_id)
+                try:
+                    await self.bot.send_message(chat_id, text)
+                    break
+                except TelegramRetryAfter as e:
+                    logger.warning(f"Telegram flood limit, waiting {e.retry_after}s")
+                    self._next_at = time.monotonic() + e.retry_after
+                except (TelegramForbiddenError, TelegramBadRequest) as e:
+                    # Пользователь заблокировал бота или чата нет — повтор не поможет
+                    logger.warning(f"Cannot send to {chat_id}: {e}")
+                    break
+                except Exception:
+                    logger.exception(f"Failed to send message to {chat_id}")
+                finally:
+                    sent_at = time.monotonic()
+                    self._last_sent[chat_id] = sent_at
+                    self._next_at = max(self._next_at, sent_at + GLOBAL_INTERVAL)
+
+
+def format_notification(event: dict) -> str:
+    header = f"Клиент: {event['client_name']}\nДата: {event['lesson_datetime']}"
+    if event["status"] == "done":
+        text = f"Анализ записи готов!\n\n{header}\nОценка: {event['score']}/10"
+        if event.get("summary"):
+            text += f"\n\n{event['summary']}"
+        return text
+    return (
+        f"Не удалось обработать запись.\n\n{header}\n\n"
+        "Администратор может запустить обработку повторно."
+    )
+
+
+async def handle_event(request: web.Request) -> web.Response:
+    """Событие завершения обработки от backend (POST /events)."""
+    # Пустой секрет совпал бы с пустым заголовком — такой запрос не принимаем
+    secret = request.headers.get("X-Webhook-Secret", "")
+    if not NOTIFY_SECRET or not hmac.compare_digest(secret, NOTIFY_SECRET):
+        return web.Response(status=401)
+    try:
+        event = await request.json()
+        telegram_id, text = event["telegram_id"], format_notification(event)
+    except (ValueError, KeyError, TypeError):
+        return web.Response(status=400)
+    queue: SendQueue = request.app["send_queue"]
+    if not queue.put(telegram_id, text):
+        return web.Response(status=503)
+    return web.Response(status=204)
+
+
+async def start_notification_server(send_queue: SendQueue) -> web.AppRunner | None:
+    """HTTP-эндпоинт для backend. Без NOTIFY_SECRET не запускается (None)."""
+    if not NOTIFY_SECRET:
+        logger.warning("NOTIFY_SECRET is not set, notification server is disabled")
+        return None
+    app = web.Application()
+    app["send_queue"] = send_queue
+    app.router.add_post("/events", handle_event)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, NOTIFY_HOST, NOTIFY_PORT).start()
+    logger.info(f"Notification server listening on {NOTIFY_HOST}:{NOTIFY_PORT}")
+    return runner
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import logging
+from typing import AsyncIterator
+import httpx
+from pyrogram import Client as PyrogramClient
+from config import BACKEND_URL
+
+logger = logging.getLogger(__name__)
+
+# Сколько чанков (по 1 МБ у Pyrogram) скачивание может опередить отправку
+PREFETCH_CHUNKS = 4
+TELEGRAM_CHUNK = 1024 * 1024
+# Попытки дослать файл после обрыва и паузы между ними (сек)
+UPLOAD_ATTEMPTS = 5
+RETRY_DELAY = 2
+# Тело идёт потоком: таймаут — на каждый чанк и на ответ, а не на весь файл
+UPLOAD_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+class UploadError(Exception):
+    """Backend отклонил загрузку (текст ответа — для пользователя)."""
+
+
+class DownloadError(Exception):
+    """Не удалось скачать файл из Telegram."""
+
+
+class RelayStats:
+    """Сколько байт прошло через relay (для лога после загрузки)."""
+
+    def __init__(self):
+        self.bytes = 0
+
+
+def idempotency_key(file: dict, form: dict) -> str:
+    """Один файл Telegram для одного урока одного сотрудника — одна запись."""
+    raw = f"{file['file_unique_id']}:{form['employee_telegram_id']}:{form['lesson_datetime']}:{form['client_name']}"
+    return "tg:" + hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def prefetch(chunks: AsyncIterator[bytes], depth: int = PREFETCH_CHUNKS) -> AsyncIterator[bytes]:
+    """Читает источник в фоне через очередь из depth чанков.
+
+    Скачивание из Telegram и отправка в backend идут одновременно, а
+    в памяти держится не больше depth чанков. Ошибка источника
+    пробрасывается потребителю как DownloadError.
+    """
+    queue: asyncio.Queue = asyncio.Queue(depth)
+    done = object()
+
+    async def produce():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+            await queue.put(done)
+        except Exception as e:
+            await queue.put(e)
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise DownloadError(str(item)) from item
+            yield item
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+async def telegram_chunks(
+    pyrogram_client: PyrogramClient, file_id: str, offset: int, stats: RelayStats,
+) -> AsyncIterator[bytes]:
+    """Файл из Telegram (MTProto, лимит 2GB) начиная с байта offset.
+
+    Pyrogram отдаёт файл чанками по 1 МБ и начинает только с границы чанка —
+    лишнее начало первого чанка отрезается.
+    """
+    skip = offset % TELEGRAM_CHUNK
+    chunks = pyrogram_client.stream_media(file_id, offset=offset // TELEGRAM_CHUNK)
+    async for chunk in prefetch(chunks):
+        if skip:
+            chunk, skip = chunk[skip:], max(skip - len(chunk), 0)
+            if not chunk:
+                continue
+        stats.bytes += len(chunk)
+        yield chunk
+
+
+def _raise_for_status(resp: httpx.Response):
+    if resp.status_code >= 400:
+        raise UploadError(resp.text)
+
+
+async def relay_upload(
+    pyrogram_client: PyrogramClient, file: dict, form: dict, stats: RelayStats,
+) -> dict:
+    """Пересылает файл из Telegram в backend возобновляемой загрузкой.
+
+    Сессия создаётся по ключу идемпотентности, поэтому повтор (в том числе
+    после перезапуска бота) продолжает ту же загрузку и не создаёт вторую
+    запись. После обрыва файл досылается с подтверждённого backend offset.
+    Возвращает созданную запись.
+    """
+    base = f"{BACKEND_URL}/api/recordings/uploads"
+    async with httpx.AsyncClient(timeout=UPLOAD_TIMEOUT) as client:
+        for _ in range(UPLOAD_ATTEMPTS):
+            resp = await client.post(base, json={
+                **form, "idempotency_key": idempotency_key(file, form), "size": file.get("file_size"),
+            })
+            if resp.status_code != 503:
+                break
+            # Pipeline занят (очередь или бюджет памяти) — ждём, сколько просит backend
+            await asyncio.sleep(float(resp.headers.get("Retry-After", RETRY_DELAY)))
+        _raise_for_status(resp)
+        session = resp.json()
+        complete = _received_all(session)
+
+        for _ in range(UPLOAD_ATTEMPTS):
+            if session["status"] == "done":
+                return session["recording"]
+            if not complete:
+                try:
+                    resp = await client.put(
+                        f"{base}/{session['id']}",
+                        params={"offset": session["offset"]},
+                        content=telegram_chunks(pyrogram_client, file["file_id"], session["offset"], stats),
+                    )
+                except httpx.TransportError as e:
+                    logger.warning(f"Upload {session['id']} interrupted ({e!r}), resuming")
+                    await asyncio.sleep(RETRY_DELAY)
+                    resp = None
+                if resp is None or resp.status_code == 409:
+                    # Обрыв или расхождение offset — продолжаем с подтверждённого backend
+                    resp = await client.get(f"{base}/{session['id']}")
+                    _raise_for_status(resp)
+                    session = resp.json()
+                    complete = _received_all(session)
+                    continue
+                _raise_for_status(resp)
+                session = resp.json()
+                # Без известного размера конец файла — успешно дочитанный поток
+                complete = session["size"] is None or _received_all(session)
+                if not complete:
+                    continue
+
+            resp = await client.post(f"{base}/{session['id']}/finalize")
+            if resp.status_code == 503:
+                await asyncio.sleep(float(resp.headers.get("Retry-After", RETRY_DELAY)))
+                continue
+            if resp.status_code == 409:
+                complete = False
+                continue
+            _raise_for_status(resp)
+            return resp.json()["recording"]
+
+    raise UploadError("Не удалось загрузить файл, попробуйте позже")
+
+
+def _received_all(session: dict) -> bool:
+    return session["size"] is not None and session["offset"] >= session["size"]
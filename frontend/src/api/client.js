@@ -84,3 +84,16 @@ export async function updateSetting(key, value) {
     body: { value },
   })
 }
+
+// Поток изменений (SSE). EventSource не умеет заголовки — токен в query.
+// onEvent(type, data): type — 'recording' или 'client'; onOpen — при каждом
+// (пере)подключении, пропущенные за разрыв события надо перечитать.
+export function subscribeEvents(city, onEvent, onOpen) {
+  const params = new URLSearchParams({ city, token: getToken() || '' })
+  const source = new EventSource(`${API_BASE}/events?${params}`)
+  for (const type of ['recording', 'client']) {
+    source.addEventListener(type, (e) => onEvent(type, JSON.parse(e.data)))
+  }
+  if (onOpen) source.onopen = onOpen
+  return () => source.close()
+}
@@ -1,5 +1,5 @@
-import { useState, useEffect, useCallback } from 'react'
-import { getClients, deleteClient } from '../api/client'
+import { useState, useEffect, useCallback, useRef } from 'react'
+import { getClients, deleteClient, subscribeEvents } from '../api/client'
 import { ChevronLeft, ChevronRight, Calendar, Music, Briefcase, Pencil, Trash2 } from 'lucide-react'
 import ClientModal from '../components/ClientModal'
 import EditClientModal from '../components/EditClientModal'
@@ -30,6 +30,15 @@ function formatDate(d) {
   return `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`
 }
 
+// Поля карточки, которые меняет событие записи, по роли сотрудника
+const ROLE_FIELDS = {
+  teacher: { status: 'teacher_status', score: 'teacher_score' },
+  sales_manager: { status: 'manager_status', score: 'manager_score' },
+}
+
+// Пачка событий о незнакомых карточках — одно перечитывание доски
+const REFETCH_DELAY = 1000
+
 function getWeekDays(monday) {
   const days = []
   for (let i = 0; i < 7; i++) {
@@ -51,15 +60,15 @@ export default function AnalysesPage({ city }) {
 
   const weekDays = getWeekDays(monday)
 
-  const fetchClients = useCallback(async () => {
-    setLoading(true)
+  const fetchClients = useCallback(async ({ silent = false } = {}) => {
+    if (!silent) setLoading(true)
     try {
       const data = await getClients(city, formatDate(monday))
       setClients(data)
     } catch (err) {
       console.error(err)
     } finally {
-      setLoading(false)
+      if (!silent) setLoading(false)
     }
   }, [city, monday])
 
@@ -67,6 +76,53 @@ export default function AnalysesPage({ city }) {
     fetchClients()
   }, [fetchClients])
 
+  const clientsRef = useRef(clients)
+  clientsRef.current = clients
+
+  // Живые обновления: события применяются к карточкам на месте, а при
+  // незнакомом клиенте или переподключении доска тихо перечитывается
+  useEffect(() => {
+    let timer = null
+    let opened = false
+    const refetchSoon = () => {
+      clearTimeout(timer)
+      timer = setTimeout(() => fetchClients({ silent: true }), REFETCH_DELAY)
+    }
+    const patch = (clientId, fields) => {
+      if (!clientsRef.current.some(c => c.id === clientId)) return false
+      setClients(prev => prev.map(c => (c.id === clientId ? { ...c, ...fields } : c)))
+      return true
+    }
+
+    function handleEvent(type, event) {
+      if (type === 'recording') {
+        const fields = ROLE_FIELDS[event.role]
+        if (!event.client_id || !fields) return refetchSoon()
+        const update = { [fields.status]: event.status }
+        if (event.score !== undefined) update[fields.score] = event.score
+        if (!patch(event.client_id, update)) refetchSoon()
+      } else if (event.action === 'deleted') {
+        setClients(prev => prev.filter(c => c.id !== event.client_id))
+      } else {
+        const { name, lesson_datetime, result } = event
+        const update = Object.fromEntries(
+          Object.entries({ name, lesson_datetime, result }).filter(([, v]) => v !== undefined)
+        )
+        // Карточка с другой датой сама переедет в свой день (или уйдёт с недели)
+        if (!patch(event.client_id, update)) refetchSoon()
+      }
+    }
+
+    const unsubscribe = subscribeEvents(city, handleEvent, () => {
+      if (opened) refetchSoon()
+      opened = true
+    })
+    return () => {
+      clearTimeout(timer)
+      unsubscribe()
+    }
+  }, [city, fetchClients])
+
   function prevWeek() {
     const d = new Date(monday)
     d.setDate(d.getDate() - 7)
@@ -0,0 +1,451 @@
+-- Beethoven: агрегаты аналитики на стороне БД
+-- Выполнить после supabase_schema.sql (SQL Editor в Supabase Dashboard).
+-- Агрегаты считаются из rollup-таблиц по дням (UTC-дата lesson_datetime),
+-- которые триггеры поддерживают инкрементально. Функции принимают город и
+-- период дней [p_from, p_to] включительно и возвращают сгруппированные строки
+-- для /api/analytics. Пересборка по сырым данным: python -m app.rollups
+-- (или SELECT analytics_rollup_rebuild();).
+
+-- Оценённые записи с клиентом и сотрудником (для топов и частых ошибок)
+CREATE OR REPLACE VIEW analytics_recordings AS
+SELECT
+    r.id,
+    r.client_id,
+    r.employee_id,
+    r.score,
+    r.analysis,
+    c.name AS client_name,
+    c.city,
+    c.result,
+    c.lesson_datetime,
+    e.name AS employee_name,
+    e.role,
+    e.directions,
+    r.prompt_hash
+FROM recordings r
+JOIN clients c ON c.id = r.client_id
+JOIN employees e ON e.id = r.employee_id
+WHERE r.status = 'done' AND r.score IS NOT NULL;
+
+
+-- Старые сигнатуры (период в timestamptz) заменены на даты
+DROP FUNCTION IF EXISTS analytics_conversion(city_enum, timestamptz, timestamptz);
+DROP FUNCTION IF EXISTS analytics_weekly(city_enum, timestamptz, timestamptz);
+DROP FUNCTION IF EXISTS analytics_employees(city_enum, timestamptz, timestamptz);
+DROP FUNCTION IF EXISTS analytics_directions(city_enum, timestamptz, timestamptz);
+DROP FUNCTION IF EXISTS analytics_scores(city_enum, timestamptz, timestamptz);
+-- rollup_apply_recording получил явный список направлений, затем клиента
+DROP FUNCTION IF EXISTS rollup_apply_recording(city_enum, timestamptz, client_result, uuid, smallint, int);
+DROP FUNCTION IF EXISTS rollup_apply_recording(city_enum, timestamptz, client_result, uuid, smallint, int, text[]);
+
+
+-- ============================================================
+-- Rollup-таблицы
+-- ============================================================
+
+-- Клиенты по дням: конверсия и недельный тренд
+CREATE TABLE IF NOT EXISTS analytics_client_daily (
+    city city_enum NOT NULL,
+    day DATE NOT NULL,
+    total INT NOT NULL DEFAULT 0,
+    bought INT NOT NULL DEFAULT 0,
+    not_bought INT NOT NULL DEFAULT 0,
+    prepayment INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (city, day)
+);
+
+-- Оценённые записи по дням, сотрудникам и направлениям.
+-- direction = '' — итог по сотруднику (одна строка на запись),
+-- остальные строки — по каждому направлению сотрудника.
+-- score_hist[i] — количество оценок i (1..10).
+CREATE TABLE IF NOT EXISTS analytics_recording_daily (
+    city city_enum NOT NULL,
+    day DATE NOT NULL,
+    employee_id UUID NOT NULL REFERENCES employees(id) ON DELETE CASCADE,
+    direction TEXT NOT NULL DEFAULT '',
+    recording_count INT NOT NULL DEFAULT 0,
+    score_sum INT NOT NULL DEFAULT 0,
+    bought INT NOT NULL DEFAULT 0,
+    not_bought INT NOT NULL DEFAULT 0,
+    prepayment INT NOT NULL DEFAULT 0,
+    score_hist INT[] NOT NULL DEFAULT array_fill(0, ARRAY[10]),
+    PRIMARY KEY (city, day, employee_id, direction)
+);
+
+-- Клиенты направлений: сколько оценённых записей клиента учтено в направлении.
+-- Клиент относится к одному дню (lesson_datetime), поэтому число различных
+-- клиентов направления за период — число строк за эти дни. Строка удаляется,
+-- когда recording_count доходит до 0.
+CREATE TABLE IF NOT EXISTS analytics_direction_clients (
+    city city_enum NOT NULL,
+    day DATE NOT NULL,
+    direction TEXT NOT NULL,
+    client_id UUID NOT NULL,
+    recording_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (city, day, direction, client_id)
+);
+
+
+CREATE OR REPLACE FUNCTION rollup_day(p_ts timestamptz)
+RETURNS date
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT (p_ts AT TIME ZONE 'UTC')::date;
+$$;
+
+
+-- Текущие направления сотрудника
+CREATE OR REPLACE FUNCTION rollup_directions(p_employee_id uuid)
+RETURNS text[]
+LANGUAGE sql STABLE AS $$
+    SELECT directions::text[] FROM employees WHERE id = p_employee_id;
+$$;
+
+
+CREATE OR REPLACE FUNCTION rollup_apply_client(
+    p_city city_enum, p_lesson timestamptz, p_result client_result, p_sign int
+)
+RETURNS void
+LANGUAGE sql AS $$
+    INSERT INTO analytics_client_daily AS t (city, day, total, bought, not_bought, prepayment)
+    VALUES (
+        p_city, rollup_day(p_lesson), p_sign,
+        CASE WHEN p_result = 'bought' THEN p_sign ELSE 0 END,
+        CASE WHEN p_result = 'not_bought' THEN p_sign ELSE 0 END,
+        CASE WHEN p_result = 'prepayment' THEN p_sign ELSE 0 END
+    )
+    ON CONFLICT (city, day) DO UPDATE SET
+        total = t.total + EXCLUDED.total,
+        bought = t.bought + EXCLUDED.bought,
+        not_bought = t.not_bought + EXCLUDED.not_bought,
+        prepayment = t.prepayment + EXCLUDED.prepayment;
+$$;
+
+
+-- p_directions — направления, по которым запись учтена (или снимается).
+-- Строки rollup всегда соответствуют текущим направлениям сотрудника:
+-- при их изменении rollup_employees_trigger переносит вклад.
+CREATE OR REPLACE FUNCTION rollup_apply_recording(
+    p_city city_enum, p_lesson timestamptz, p_result client_result,
+    p_employee_id uuid, p_score smallint, p_sign int, p_directions text[], p_client_id uuid
+)
+RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_hist int[] := array_fill(0, ARRAY[10]);
+BEGIN
+    v_hist[p_score] := p_sign;
+
+    INSERT INTO analytics_recording_daily AS t (
+        city, day, employee_id, direction, recording_count, score_sum,
+        bought, not_bought, prepayment, score_hist
+    )
+    SELECT
+        p_city, rollup_day(p_lesson), p_employee_id, dir, p_sign, p_sign * p_score,
+        CASE WHEN p_result = 'bought' THEN p_sign ELSE 0 END,
+        CASE WHEN p_result = 'not_bought' THEN p_sign ELSE 0 END,
+        CASE WHEN p_result = 'prepayment' THEN p_sign ELSE 0 END,
+        v_hist
+    FROM (
+        SELECT ''::text AS dir
+        UNION ALL
+        SELECT unnest(coalesce(p_directions, '{}'))::text
+    ) dirs
+    ON CONFLICT (city, day, employee_id, direction) DO UPDATE SET
+        recording_count = t.recording_count + EXCLUDED.recording_count,
+        score_sum = t.score_sum + EXCLUDED.score_sum,
+        bought = t.bought + EXCLUDED.bought,
+        not_bought = t.not_bought + EXCLUDED.not_bought,
+        prepayment = t.prepayment + EXCLUDED.prepayment,
+        score_hist = ARRAY(
+            SELECT a + b
+            FROM unnest(t.score_hist, EXCLUDED.score_hist) WITH ORDINALITY AS h(a, b, i)
+            ORDER BY i
+        );
+
+    INSERT INTO analytics_direction_clients AS t (city, day, direction, client_id, recording_count)
+    SELECT p_city, rollup_day(p_lesson), dir, p_client_id, p_sign
+    FROM unnest(coalesce(p_directions, '{}')) AS dir
+    ON CONFLICT (city, day, direction, client_id) DO UPDATE SET
+        recording_count = t.recording_count + EXCLUDED.recording_count;
+    DELETE FROM analytics_direction_clients
+    WHERE city = p_city AND day = rollup_day(p_lesson) AND client_id = p_client_id
+      AND recording_count <= 0;
+END;
+$$;
+
+
+-- Запись учитывается, пока она в статусе done с оценкой
+CREATE OR REPLACE FUNCTION rollup_recordings_trigger()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    c clients%ROWTYPE;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'done' AND OLD.score IS NOT NULL THEN
+        SELECT * INTO c FROM clients WHERE id = OLD.client_id;
+        -- При каскадном удалении клиента его вклад уже снят rollup_clients_before_delete
+        IF FOUND THEN
+            PERFORM rollup_apply_recording(
+                c.city, c.lesson_datetime, c.result, OLD.employee_id, OLD.score, -1,
+                rollup_directions(OLD.employee_id), OLD.client_id
+            );
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'done' AND NEW.score IS NOT NULL THEN
+        SELECT * INTO c FROM clients WHERE id = NEW.client_id;
+        PERFORM rollup_apply_recording(
+            c.city, c.lesson_datetime, c.result, NEW.employee_id, NEW.score, 1,
+            rollup_directions(NEW.employee_id), NEW.client_id
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+
+-- Изменение клиента переносит его вклад и вклад его записей
+CREATE OR REPLACE FUNCTION rollup_clients_trigger()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    r recordings%ROWTYPE;
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.city, OLD.lesson_datetime, OLD.result)
+            IS NOT DISTINCT FROM (NEW.city, NEW.lesson_datetime, NEW.result) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM rollup_apply_client(OLD.city, OLD.lesson_datetime, OLD.result, -1);
+        FOR r IN SELECT * FROM recordings
+                 WHERE client_id = NEW.id AND status = 'done' AND score IS NOT NULL LOOP
+            PERFORM rollup_apply_recording(
+                OLD.city, OLD.lesson_datetime, OLD.result, r.employee_id, r.score, -1,
+                rollup_directions(r.employee_id), OLD.id
+            );
+            PERFORM rollup_apply_recording(
+                NEW.city, NEW.lesson_datetime, NEW.result, r.employee_id, r.score, 1,
+                rollup_directions(r.employee_id), NEW.id
+            );
+        END LOOP;
+    END IF;
+    PERFORM rollup_apply_client(NEW.city, NEW.lesson_datetime, NEW.result, 1);
+    RETURN NULL;
+END;
+$$;
+
+
+CREATE OR REPLACE FUNCTION rollup_clients_before_delete()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    r recordings%ROWTYPE;
+BEGIN
+    PERFORM rollup_apply_client(OLD.city, OLD.lesson_datetime, OLD.result, -1);
+    FOR r IN SELECT * FROM recordings
+             WHERE client_id = OLD.id AND status = 'done' AND score IS NOT NULL LOOP
+        PERFORM rollup_apply_recording(
+            OLD.city, OLD.lesson_datetime, OLD.result, r.employee_id, r.score, -1,
+            rollup_directions(r.employee_id), OLD.id
+        );
+    END LOOP;
+    RETURN OLD;
+END;
+$$;
+
+
+-- Смена направлений сотрудника переносит вклад его оценённых записей со
+-- старых направлений на новые (строка итога '' при этом не меняется: -1 и +1)
+CREATE OR REPLACE FUNCTION rollup_employees_trigger()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    rec record;
+BEGIN
+    IF OLD.directions IS NOT DISTINCT FROM NEW.directions THEN
+        RETURN NULL;
+    END IF;
+    FOR rec IN
+        SELECT c.city, c.lesson_datetime, c.result, r.score, r.client_id
+        FROM recordings r
+        JOIN clients c ON c.id = r.client_id
+        WHERE r.employee_id = NEW.id AND r.status = 'done' AND r.score IS NOT NULL
+    LOOP
+        PERFORM rollup_apply_recording(
+            rec.city, rec.lesson_datetime, rec.result, NEW.id, rec.score, -1, OLD.directions::text[],
+            rec.client_id
+        );
+        PERFORM rollup_apply_recording(
+            rec.city, rec.lesson_datetime, rec.result, NEW.id, rec.score, 1, NEW.directions::text[],
+            rec.client_id
+        );
+    END LOOP;
+    RETURN NULL;
+END;
+$$;
+
+
+DROP TRIGGER IF EXISTS rollup_recordings ON recordings;
+CREATE TRIGGER rollup_recordings
+    AFTER INSERT OR DELETE OR UPDATE OF status, score, client_id, employee_id ON recordings
+    FOR EACH ROW EXECUTE FUNCTION rollup_recordings_trigger();
+
+DROP TRIGGER IF EXISTS rollup_clients ON clients;
+CREATE TRIGGER rollup_clients
+    AFTER INSERT OR UPDATE OF city, lesson_datetime, result ON clients
+    FOR EACH ROW EXECUTE FUNCTION rollup_clients_trigger();
+
+DROP TRIGGER IF EXISTS rollup_clients_delete ON clients;
+CREATE TRIGGER rollup_clients_delete
+    BEFORE DELETE ON clients
+    FOR EACH ROW EXECUTE FUNCTION rollup_clients_before_delete();
+
+DROP TRIGGER IF EXISTS rollup_employees ON employees;
+CREATE TRIGGER rollup_employees
+    AFTER UPDATE OF directions ON employees
+    FOR EACH ROW EXECUTE FUNCTION rollup_employees_trigger();
+
+
+-- Полная пересборка rollup-таблиц из сырых данных
+CREATE OR REPLACE FUNCTION analytics_rollup_rebuild()
+RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    rec record;
+BEGIN
+    DELETE FROM analytics_client_daily WHERE true;
+    DELETE FROM analytics_recording_daily WHERE true;
+    DELETE FROM analytics_direction_clients WHERE true;
+
+    INSERT INTO analytics_client_daily (city, day, total, bought, not_bought, prepayment)
+    SELECT
+        city,
+        rollup_day(lesson_datetime),
+        count(*),
+        count(*) FILTER (WHERE result = 'bought'),
+        count(*) FILTER (WHERE result = 'not_bought'),
+        count(*) FILTER (WHERE result = 'prepayment')
+    FROM clients
+    GROUP BY 1, 2;
+
+    FOR rec IN
+        SELECT c.city, c.lesson_datetime, c.result, r.employee_id, r.score, e.directions, r.client_id
+        FROM recordings r
+        JOIN clients c ON c.id = r.client_id
+        JOIN employees e ON e.id = r.employee_id
+        WHERE r.status = 'done' AND r.score IS NOT NULL
+    LOOP
+        PERFORM rollup_apply_recording(
+            rec.city, rec.lesson_datetime, rec.result, rec.employee_id, rec.score, 1, rec.directions::text[],
+            rec.client_id
+        );
+    END LOOP;
+END;
+$$;
+
+
+-- ============================================================
+-- Функции для /api/analytics
+-- ============================================================
+
+-- 1. Конверсия
+CREATE OR REPLACE FUNCTION analytics_conversion(p_city city_enum, p_from date, p_to date)
+RETURNS TABLE (bought bigint, not_bought bigint, prepayment bigint, total bigint)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        coalesce(sum(bought), 0)::bigint,
+        coalesce(sum(not_bought), 0)::bigint,
+        coalesce(sum(prepayment), 0)::bigint,
+        coalesce(sum(total), 0)::bigint
+    FROM analytics_client_daily
+    WHERE city = p_city AND day BETWEEN p_from AND p_to;
+$$;
+
+
+-- 2. Тренд по неделям (понедельник недели)
+CREATE OR REPLACE FUNCTION analytics_weekly(p_city city_enum, p_from date, p_to date)
+RETURNS TABLE (week_start date, total bigint, bought bigint, not_bought bigint, prepayment bigint)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        date_trunc('week', day)::date,
+        sum(total)::bigint,
+        sum(bought)::bigint,
+        sum(not_bought)::bigint,
+        sum(prepayment)::bigint
+    FROM analytics_client_daily
+    WHERE city = p_city AND day BETWEEN p_from AND p_to
+    GROUP BY 1
+    HAVING sum(total) > 0
+    ORDER BY 1;
+$$;
+
+
+-- 3. Рейтинг сотрудников
+CREATE OR REPLACE FUNCTION analytics_employees(p_city city_enum, p_from date, p_to date)
+RETURNS TABLE (employee_name text, role employee_role, avg_score numeric, recording_count bigint)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        e.name,
+        e.role,
+        round(sum(t.score_sum)::numeric / sum(t.recording_count), 1),
+        sum(t.recording_count)::bigint
+    FROM analytics_recording_daily t
+    JOIN employees e ON e.id = t.employee_id
+    WHERE t.city = p_city AND t.day BETWEEN p_from AND p_to AND t.direction = ''
+    GROUP BY e.id, e.name, e.role
+    HAVING sum(t.recording_count) > 0
+    ORDER BY 3 DESC;
+$$;
+
+
+-- 4. По направлениям: client_count — различные клиенты (как в исходном запросе),
+-- остальные счётчики — по оценённым записям
+CREATE OR REPLACE FUNCTION analytics_directions(p_city city_enum, p_from date, p_to date)
+RETURNS TABLE (
+    direction text, client_count bigint, bought bigint, not_bought bigint,
+    prepayment bigint, avg_score numeric
+)
+LANGUAGE sql STABLE AS $$
+    WITH scored AS (
+        SELECT
+            direction,
+            sum(recording_count) AS recording_count,
+            sum(score_sum) AS score_sum,
+            sum(bought) AS bought,
+            sum(not_bought) AS not_bought,
+            sum(prepayment) AS prepayment
+        FROM analytics_recording_daily
+        WHERE city = p_city AND day BETWEEN p_from AND p_to AND direction <> ''
+        GROUP BY direction
+        HAVING sum(recording_count) > 0
+    ), direction_clients AS (
+        SELECT direction, count(*) AS client_count
+        FROM analytics_direction_clients
+        WHERE city = p_city AND day BETWEEN p_from AND p_to
+        GROUP BY direction
+    )
+    SELECT
+        r.direction,
+        coalesce(c.client_count, 0)::bigint,
+        r.bought::bigint,
+        r.not_bought::bigint,
+        r.prepayment::bigint,
+        round(r.score_sum::numeric / r.recording_count, 1)
+    FROM scored r
+    LEFT JOIN direction_clients c USING (direction)
+    ORDER BY r.direction;
+$$;
+
+
+-- 5. Распределение оценок
+CREATE OR REPLACE FUNCTION analytics_scores(p_city city_enum, p_from date, p_to date)
+RETURNS TABLE (score int, count bigint)
+LANGUAGE sql STABLE AS $$
+    SELECT i, sum(score_hist[i])::bigint
+    FROM analytics_recording_daily, generate_series(1, 10) AS i
+    WHERE city = p_city AND day BETWEEN p_from AND p_to AND direction = ''
+    GROUP BY i
+    ORDER BY i;
+$$;
+
+-- 6. Топ лучших/худших и частые ошибки читаются из analytics_recordings
+-- с ORDER BY score и LIMIT.
@@ -39,6 +39,16 @@ CREATE TABLE recordings (
     analysis TEXT,
     score SMALLINT CHECK (score >= 1 AND score <= 10),
     status recording_status DEFAULT 'pending',
+    -- Карта времени после вырезания тишины: [[начало в обрезанном, начало в исходном, длительность], ...]
+    time_map JSONB,
+    -- sha256 промпта, которым получены analysis и score (для переанализа)
+    prompt_hash TEXT,
+    -- Последний завершённый этап pipeline: compressed | transcribed | analyzed
+    -- (retry начинает со следующего) и текст последней ошибки
+    stage TEXT,
+    error TEXT,
+    -- Ключ идемпотентности загрузки: повтор той же загрузки не создаёт вторую запись
+    idempotency_key TEXT UNIQUE,
     created_at TIMESTAMPTZ DEFAULT now()
 );
 
@@ -49,6 +59,48 @@ CREATE TABLE settings (
     updated_at TIMESTAMPTZ DEFAULT now()
 );
 
+-- Кэш транскрипций: одинаковое аудио (sha256 исходного файла) с той же
+-- моделью и промптом STT повторно не транскрибируется
+CREATE TABLE IF NOT EXISTS transcription_cache (
+    audio_hash TEXT NOT NULL,
+    stt_model TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    transcription TEXT NOT NULL,
+    time_map JSONB,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (audio_hash, stt_model, prompt_hash)
+);
+
+-- Кэш анализов: та же транскрипция с тем же промптом и моделью
+-- повторно в LLM не отправляется
+CREATE TABLE IF NOT EXISTS analysis_cache (
+    transcript_hash TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    score SMALLINT CHECK (score >= 1 AND score <= 10),
+    created_at TIMESTAMPTZ DEFAULT now(),
+    PRIMARY KEY (transcript_hash, prompt_hash, model)
+);
+
+-- Запуски переанализа после смены промпта (status: running | cancelled | done | failed)
+CREATE TABLE IF NOT EXISTS reanalysis_runs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    prompt_key TEXT NOT NULL,
+    city city_enum,
+    date_from DATE,
+    date_to DATE,
+    prompt_hash TEXT,
+    status TEXT NOT NULL DEFAULT 'running',
+    total INT NOT NULL DEFAULT 0,
+    processed INT NOT NULL DEFAULT 0,
+    failed INT NOT NULL DEFAULT 0,
+    error TEXT,
+    heartbeat_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
 -- Начальные настройки
 INSERT INTO settings (key, value) VALUES
 ('admin_password', 'changeme'),
@@ -117,5 +169,72 @@ CREATE INDEX idx_recordings_client_id ON recordings(client_id);
 CREATE INDEX idx_recordings_status ON recordings(status);
 CREATE INDEX idx_employees_telegram_id ON employees(telegram_id);
 
+-- Приём записи одной транзакцией (POST /api/recordings): находит сотрудника,
+-- создаёт клиента или дописывает ему результат (конкурентные загрузки одного
+-- урока не конфликтуют по UNIQUE), создаёт запись. NULL — сотрудник не найден.
+-- С ключом идемпотентности повтор возвращает уже созданную запись с created = false.
+DROP FUNCTION IF EXISTS ingest_recording(BIGINT, TEXT, city_enum, TIMESTAMPTZ, client_result);
+CREATE OR REPLACE FUNCTION ingest_recording(
+    p_telegram_id BIGINT,
+    p_client_name TEXT,
+    p_city city_enum,
+    p_lesson_datetime TIMESTAMPTZ,
+    p_result client_result,
+    p_idempotency_key TEXT DEFAULT NULL
+) RETURNS JSONB
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_employee employees;
+    v_client clients;
+    v_recording recordings;
+BEGIN
+    SELECT * INTO v_employee FROM employees WHERE telegram_id = p_telegram_id;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    IF p_idempotency_key IS NOT NULL THEN
+        SELECT * INTO v_recording FROM recordings WHERE idempotency_key = p_idempotency_key;
+        IF FOUND THEN
+            SELECT * INTO v_client FROM clients WHERE id = v_recording.client_id;
+            RETURN jsonb_build_object(
+                'employee', to_jsonb(v_employee),
+                'client', to_jsonb(v_client),
+                'recording', to_jsonb(v_recording),
+                'created', false
+            );
+        END IF;
+    END IF;
+
+    INSERT INTO clients (name, city, lesson_datetime, result)
+    VALUES (p_client_name, p_city, p_lesson_datetime, p_result)
+    ON CONFLICT (name, city, lesson_datetime) DO UPDATE
+        SET result = COALESCE(clients.result, EXCLUDED.result)
+    RETURNING * INTO v_client;
+
+    -- Конкурентный повтор с тем же ключом упадёт на UNIQUE и откатится
+    INSERT INTO recordings (client_id, employee_id, audio_path, status, idempotency_key)
+    VALUES (v_client.id, v_employee.id, '', 'pending', p_idempotency_key)
+    RETURNING * INTO v_recording;
+
+    RETURN jsonb_build_object(
+        'employee', to_jsonb(v_employee),
+        'client', to_jsonb(v_client),
+        'recording', to_jsonb(v_recording),
+        'created', true
+    );
+END;
+$$;
+
 -- Storage bucket (выполнить через Supabase Dashboard или API):
 -- Создать bucket "audio" с public access = false
+
+-- Миграции существующей базы (безопасно выполнять повторно;
+-- новые таблицы выше создаются через CREATE TABLE IF NOT EXISTS)
+ALTER TABLE recordings ADD COLUMN IF NOT EXISTS time_map JSONB;
+ALTER TABLE recordings ADD COLUMN IF NOT EXISTS prompt_hash TEXT;
+ALTER TABLE recordings ADD COLUMN IF NOT EXISTS stage TEXT;
+ALTER TABLE recordings ADD COLUMN IF NOT EXISTS error TEXT;
+ALTER TABLE recordings ADD COLUMN IF NOT EXISTS idempotency_key TEXT UNIQUE;
+UPDATE recordings SET stage = CASE WHEN status = 'done' THEN 'analyzed' ELSE 'transcribed' END
+WHERE stage IS NULL AND transcription IS NOT NULL;